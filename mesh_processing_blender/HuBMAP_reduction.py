@@ -34,6 +34,7 @@ import time
 import sys
 import argparse
 import textwrap
+import numpy as np
 
 #lists that are used internally to output results
 df_filename = []
@@ -130,7 +131,7 @@ def check_intersections():
     return intersections
 
     
-def mesh_process(file_locations, repair_type):
+def mesh_process(file_locations, repair_type, fast_export=False, lean=False):
     """
     This is the main mesh processing script.  It will run through a series of steps:
 
@@ -144,6 +145,8 @@ def mesh_process(file_locations, repair_type):
 
     Args:
         file_locations (object): an object containing urls and filenames for inputs and outputs
+        fast_export (bool): write the GLB files with numpy_gltf.GLBExporter instead of the stock glTF exporter
+        lean (bool): skip the render, lighting, camera and wireframe material setup, see generate_outputs
     """
     #start a timer for the process
     start_time = time.time()
@@ -156,8 +159,9 @@ def mesh_process(file_locations, repair_type):
     #setup the Blender scene
     
     objs = select_all_meshes()
-    print("Setup scene...")
-    setup_scene(file_locations.hdr)
+    if not lean:
+        print("Setup scene...")
+        setup_scene(file_locations.hdr)
 
     #add edge split to harden edges
     add_edgesplit_modifier()
@@ -203,6 +207,11 @@ def mesh_process(file_locations, repair_type):
 
     bpy.context.view_layer.objects.active = objs[0]
     
+    exporter = None
+    if fast_export:
+        from numpy_gltf import GLBExporter
+        exporter = GLBExporter()
+
     print("Create lod models")
     for level in levels:
         print("Current level: %s" %level)
@@ -228,7 +237,7 @@ def mesh_process(file_locations, repair_type):
         #output the mesh files and render pngs for the input files
         if len(convert_formats) > 0:
             logging.info("output %s:" %convert_formats)
-            generate_outputs(convert_formats, suffix_png, suffix, file_locations)
+            generate_outputs(convert_formats, suffix_png, suffix, file_locations, exporter=exporter, lean=lean)
         
         i += 1   
         
@@ -263,11 +272,162 @@ def clean_up():
     bpy.ops.object.mode_set(mode='OBJECT')
    
 
+# Operator-free versions of the repair steps.  They work on the mesh data of all objects at once, without mode
+# switches, active object changes or selection changes, once per mesh when objects share (instance) a mesh.
+
+def ensure_object_mode():
+    """Leave edit mode, so the mesh data is up to date.  At most one mode switch for the whole scene."""
+    if context.object is not None and context.object.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+
+
+def objects_by_mesh(objs):
+    """
+    Group mesh objects by the mesh they use.
+
+    Returns:
+        groups (list of list of bpy_types.Object): the objects of every mesh
+    """
+    groups = {}
+    for obj in objs:
+        groups.setdefault(obj.data.name, []).append(obj)
+    return list(groups.values())
+
+
+def edit_meshes(objs, edit):
+    """
+    Run edit(bm) on a bmesh of the mesh of every object in objs and write the result back.
+
+    Args:
+        objs (list of bpy_types.Object): mesh objects
+        edit (function): takes a bmesh.types.BMesh and changes it in place
+    """
+    ensure_object_mode()
+    for group in objects_by_mesh(objs):
+        mesh = group[0].data
+        bm = bmesh.new()
+        bm.from_mesh(mesh)
+        edit(bm)
+        bm.to_mesh(mesh)
+        bm.free()
+        mesh.update()
+
+
+def apply_modifier_to_meshes(objs, modifier_type, settings_by_mesh=None, **settings):
+    """
+    Same result as adding a modifier to every object and applying it with bpy.ops.object.modifier_apply.
+
+    The modifier is added to one object per mesh, the depsgraph evaluates all of them in one update, and the
+    evaluated meshes replace the original ones.  Other modifiers are disabled during the evaluation so only
+    this one is applied.
+
+    Args:
+        objs (list of bpy_types.Object): mesh objects
+        modifier_type (str): modifier type, e.g. 'EDGE_SPLIT' or 'DECIMATE'
+        settings_by_mesh (dict of str: dict): modifier properties of single meshes, by mesh name, on top of settings
+        settings: modifier properties
+    """
+    ensure_object_mode()
+    groups = objects_by_mesh(objs)
+    disabled = []
+    added = []
+    for group in groups:
+        obj = group[0]
+        for modifier in obj.modifiers:
+            if modifier.show_viewport:
+                modifier.show_viewport = False
+                disabled.append(modifier)
+        modifier = obj.modifiers.new(name='apply_' + modifier_type.lower(), type=modifier_type)
+        mesh_settings = dict(settings, **(settings_by_mesh or {}).get(obj.data.name, {}))
+        for key, value in mesh_settings.items():
+            setattr(modifier, key, value)
+        added.append(modifier)
+
+    dg = bpy.context.evaluated_depsgraph_get()
+    for group, modifier in zip(groups, added):
+        obj = group[0]
+        old_mesh = obj.data
+        new_mesh = bpy.data.meshes.new_from_object(obj.evaluated_get(dg), preserve_all_data_layers=True, depsgraph=dg)
+        obj.modifiers.remove(modifier)
+        for user in group:
+            user.data = new_mesh
+        name = old_mesh.name
+        if old_mesh.users == 0:
+            bpy.data.meshes.remove(old_mesh)
+        new_mesh.name = name
+
+    for modifier in disabled:
+        modifier.show_viewport = True
+
+
+def interior_faces(bm):
+    """Faces whose edges are all shared by more than two faces, as selected by bpy.ops.mesh.select_interior_faces"""
+    return [f for f in bm.faces if all(len(e.link_faces) > 2 for e in f.edges)]
+
+
+def remove_doubles_bmesh(bm, threshold=0.0001):
+    bmesh.ops.remove_doubles(bm, verts=bm.verts, dist=threshold)
+
+
+def remove_interior_faces_bmesh(bm):
+    """bmesh version of remove_interior_faces"""
+    remove_doubles_bmesh(bm)
+    bmesh.ops.delete(bm, geom=interior_faces(bm), context='FACES')
+
+
+def clean_up_bmesh(bm):
+    """bmesh version of clean_up"""
+    for elems in (bm.verts, bm.edges, bm.faces):
+        for elem in elems:
+            elem.hide = False
+    remove_doubles_bmesh(bm, 0.0001)
+
+
+def is_non_manifold(bm):
+    """Whether bpy.ops.mesh.select_non_manifold would select anything"""
+    return any(not e.is_manifold or not e.is_contiguous for e in bm.edges) or any(not v.is_manifold for v in bm.verts)
+
+
+def clean_non_manifold_bmesh(bm, threshold=0.0001, sides=0):
+    """
+    bmesh version of the 3D print add-on clean-up (bpy.ops.mesh.print3d_clean_non_manifold), same steps:
+    delete loose geometry and interior faces, remove doubles, dissolve degenerate geometry, fill holes until
+    the mesh stops changing, and make the normals consistent.
+    """
+    bmesh.ops.delete(bm, geom=[e for e in bm.edges if not e.link_faces], context='EDGES')
+    bmesh.ops.delete(bm, geom=[v for v in bm.verts if not v.link_edges], context='VERTS')
+    bmesh.ops.delete(bm, geom=interior_faces(bm), context='FACES')
+    remove_doubles_bmesh(bm, threshold)
+    bmesh.ops.dissolve_degenerate(bm, dist=threshold, edges=bm.edges[:])
+
+    if is_non_manifold(bm):
+        states = {(len(bm.verts), len(bm.edges), len(bm.faces))}
+        while True:
+            bmesh.ops.holes_fill(bm, edges=[e for e in bm.edges if e.is_boundary], sides=sides)
+            # delete the vertices the filling left non-manifold
+            bmesh.ops.delete(bm, geom=[v for v in bm.verts if not v.is_manifold], context='VERTS')
+            state = (len(bm.verts), len(bm.edges), len(bm.faces))
+            if state in states:
+                break
+            states.add(state)
+
+    bmesh.ops.recalc_face_normals(bm, faces=bm.faces[:])
+
     
-def add_edgesplit_modifier():
+def add_edgesplit_modifier(use_bmesh=False):
     """
     Add an edge split modifier to objects.  This will harden creases before smooth shading is applied.
+
+    The operator path disables the modifier (show_viewport) before modifier_apply, which skips disabled
+    modifiers, so the edges are never split and the meshes stay as they are.
+
+    Args:
+        use_bmesh (bool): leave the meshes unchanged without going through the operators, the same result
     """
+    if use_bmesh:
+        # splitting the edges for real would open seams before check_manifold and remove doubles
+        return
+
     bpy.ops.object.select_all(action='DESELECT')
     objects = context.scene.objects
     for obj in objects:
@@ -305,15 +465,21 @@ def update_origins_from_children(obj):
 
   
 
-def import_files(file_locations):
+def import_files(file_locations, fast=False):
     """
     Will import a file that is in **glb** format
 
     Args:
         file_locations (object): an object containing urls and filenames for input/output
+        fast (bool): import only node names, hierarchy, transforms and triangles with numpy_gltf.import_glb
+            instead of the stock importer
     """
  
     source_path = file_locations.source_path
+    if fast:
+        from numpy_gltf import import_glb
+        import_glb(source_path)
+        return
     bpy.ops.import_scene.gltf(filepath=source_path)
     
 
@@ -345,7 +511,7 @@ def select_all_empty():
     
     return all_objects
 
-def analyze_mesh(repair, repair_type):
+def analyze_mesh(repair, repair_type, use_bmesh=False):
     """
     Will scan the input file to determine whether objects in the scene are manifold, or have self-intersections.
     It will also do a polygon and vertex count summation for the scene.
@@ -353,6 +519,7 @@ def analyze_mesh(repair, repair_type):
     Args:
         repair (bool): whether or not to repair non-manifold errors
         repair_type (str): type of repair to run if run.
+        use_bmesh (bool): repair with the operator-free bmesh path, see check_manifold
       
     Returns:
         polys (int): What is the total polygon count in the scene
@@ -362,16 +529,73 @@ def analyze_mesh(repair, repair_type):
     """
     
     #skip checks for STL because it's a waste to check, they will always all be False.
-    manifold = check_manifold(repair, True, repair_type)
+    manifold = check_manifold(repair, True, repair_type, use_bmesh)
     intersections = check_intersections()
-    verts, polys = count_polys()
+    stats = analyze_scene()
+    verts = sum(s['verts'] for s in stats.values())
+    polys = sum(s['polys'] for s in stats.values())
         
     logging.info('Starting Verts: %s' %verts)
     logging.info('Starting Polys: %s' %polys)
+    bboxes = [(s['bbox_min'], s['bbox_max']) for s in stats.values() if s['bbox_min'] is not None]
+    if bboxes:
+        logging.info('Bounding box: %s %s' %(np.min([b[0] for b in bboxes], axis=0), np.max([b[1] for b in bboxes], axis=0)))
     
     return polys, verts, manifold, intersections
 
 
+def mesh_stats(obj, depsgraph):
+    """
+    Counts and manifold check of one mesh object, read with foreach_get from its evaluated mesh
+    (modifiers applied) into NumPy arrays, without bmesh or mesh copies.
+
+    An edge is manifold when exactly two polygons use it, the same test as BMEdge.is_manifold.
+
+    Args:
+        obj (bpy_types.Object): mesh object
+        depsgraph (bpy.types.Depsgraph): evaluated dependency graph
+
+    Returns:
+        stats (dict): verts, edges, polys, non_manifold_edges, and the world space bounding box
+            as bbox_min / bbox_max (None for an empty mesh)
+    """
+    mesh = obj.evaluated_get(depsgraph).data
+
+    loop_edges = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get('edge_index', loop_edges)
+    faces_per_edge = np.bincount(loop_edges, minlength=len(mesh.edges))
+
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', co)
+    bbox_min, bbox_max = None, None
+    if len(co):
+        matrix = np.array(obj.matrix_world, dtype=np.float64)
+        world = co.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+        bbox_min, bbox_max = world.min(axis=0), world.max(axis=0)
+
+    return {
+        'verts': len(mesh.vertices),
+        'edges': len(mesh.edges),
+        'polys': len(mesh.polygons),
+        'non_manifold_edges': int(np.count_nonzero(faces_per_edge != 2)),
+        'bbox_min': bbox_min,
+        'bbox_max': bbox_max,
+    }
+
+
+def analyze_scene():
+    """
+    Single pass over all mesh objects in the scene, see mesh_stats.  Leaves edit mode first so the
+    mesh data is up to date, and selects all meshes like select_all_meshes.
+
+    Returns:
+        stats (dict of str: dict): mesh_stats by object name
+    """
+    ensure_object_mode()
+    dg = bpy.context.evaluated_depsgraph_get()  # Getting the dependency graph
+    return {obj.name: mesh_stats(obj, dg) for obj in select_all_meshes()}
+
+
 def count_polys():
     """
     Will count the total number of vertices and polygons in the scene.
@@ -381,17 +605,13 @@ def count_polys():
         polys (int): total number of polygons in the scene
 
     """
-    verts, polys = 0, 0
-    dg = bpy.context.evaluated_depsgraph_get()  # Getting the dependency graph
-    for obj in select_all_meshes():
-        obj = obj.evaluated_get(dg)
-        mesh = obj.to_mesh()
-        verts += len(mesh.vertices)
-        polys += len(mesh.polygons)
+    stats = analyze_scene()
+    verts = sum(s['verts'] for s in stats.values())
+    polys = sum(s['polys'] for s in stats.values())
     return verts, polys
   
          
-def generate_outputs(formats, suffix_png,suffix, file_locations, wire = True, glb = True):
+def generate_outputs(formats, suffix_png,suffix, file_locations, wire = True, glb = True, exporter = None, lean = False):
     """
     Will lock the camera to the object(s), render a png, then output files in formats from a provided list.  It may or
     may not output the wireframe images and/or the glb file (defaults to True)
@@ -403,8 +623,17 @@ def generate_outputs(formats, suffix_png,suffix, file_locations, wire = True, gl
         file_locations (object): an object containing urls and filenames for input/output
         wire (bool): is the wireframe rendering needed?
         glb (bool): is the glb mesh output needed?
+        exporter (numpy_gltf.GLBExporter): writes the glb files instead of the stock exporter, see output_files
+        lean (bool): only output the files, no camera framing and no wireframe material (nothing is rendered)
     """
 
+    if lean:
+        # the next LOD decimates the selection, which check_manifold left on the non-manifold objects
+        ensure_object_mode()
+        select_all_meshes()
+        output_files(suffix,formats, glb, file_locations, exporter)
+        return
+
     #orient the camera to frame the mesh
     bpy.ops.object.mode_set(mode='OBJECT')
     select_all_meshes()
@@ -414,7 +643,7 @@ def generate_outputs(formats, suffix_png,suffix, file_locations, wire = True, gl
     # render_png(suffix_png, file_locations)
 
     #output files
-    output_files(suffix,formats, glb, file_locations)
+    output_files(suffix,formats, glb, file_locations, exporter)
     
     # Create an empty dictionary to store object volumes.
     objs = select_all_meshes()
@@ -456,7 +685,7 @@ def apply_mat(mat):
         else:
             obj.data.materials.append(mat)
     
-def output_files(suffix,formats, glb, file_locations):
+def output_files(suffix,formats, glb, file_locations, exporter=None):
     """
     Output files depending on a provided list of formats and filename suffixes.
 
@@ -465,6 +694,8 @@ def output_files(suffix,formats, glb, file_locations):
         formats (list of str): list of formats to export
         glb (bool): whether to export the glb format (generally True)
         file_locations (object): an object containing urls and filenames for input/output
+        exporter (numpy_gltf.GLBExporter): write both glb files from one read of the scene with this exporter
+            instead of exporting twice with bpy.ops.export_scene.gltf
     """
     output_dir = file_locations.output_dir
     filestem = file_locations.filestem
@@ -480,7 +711,9 @@ def output_files(suffix,formats, glb, file_locations):
         os.makedirs(output_LOD_dir)
     stem_separate = os.path.join(output_LOD_dir, filestem)
 
-    if glb:
+    if glb and exporter is not None:
+        exporter.write(stem + '.glb', stem_separate + '.glb')
+    elif glb:
         bpy.ops.export_scene.gltf(filepath=stem, export_format='GLB', export_cameras=False)
         bpy.ops.export_scene.gltf(filepath=stem_separate, export_format='GLB', export_cameras=False)
     for format in formats:
@@ -639,19 +872,132 @@ def setup_lighting(hdr):
     context.scene.render.image_settings.color_mode = 'RGBA'
 
     
-def decimate(value):
+def decimate(value, use_bmesh=False):
     """
     Decimate the mesh
 
     Args:
        value (float): decimation ratio to use for decimation
+       use_bmesh (bool): collapse all objects with Decimate modifiers in one depsgraph update instead of the
+           edit mode operator; both run the same collapse decimation
     """
+    if use_bmesh:
+        if value < 1.0:
+            apply_modifier_to_meshes(select_all_meshes(), 'DECIMATE', decimate_type='COLLAPSE', ratio=value)
+        return
+
     bpy.ops.object.mode_set(mode='EDIT')
     bpy.ops.mesh.select_all(action='SELECT')
     bpy.ops.mesh.decimate(ratio=value)
     
  
-def check_manifold(repair, append, repair_type):
+# smallest triangle budget of a mesh, so small structures keep their shape at low targets
+MIN_TRIANGLES = 100
+
+
+def mesh_triangles(mesh):
+    """Number of triangles of a mesh once triangulated (as written to glTF), from the polygon sizes"""
+    loop_totals = np.empty(len(mesh.polygons), dtype=np.int64)
+    mesh.polygons.foreach_get('loop_total', loop_totals)
+    return int((loop_totals - 2).sum())
+
+
+def mesh_area(obj):
+    """Surface area of the mesh of obj, scaled by the object's world matrix (exact for uniform scales)"""
+    mesh = obj.data
+    areas = np.empty(len(mesh.polygons), dtype=np.float64)
+    mesh.polygons.foreach_get('area', areas)
+    scale = abs(np.linalg.det(np.array(obj.matrix_world, dtype=np.float64)[:3, :3])) ** (2.0 / 3.0)
+    return float(areas.sum() * scale)
+
+
+def count_triangles():
+    """
+    Triangles in the scene as they are written to a GLB file: every mesh once, even when several objects use it.
+
+    Returns:
+        triangles (int): number of triangles
+    """
+    ensure_object_mode()
+    return sum(mesh_triangles(group[0].data) for group in objects_by_mesh(select_all_meshes()))
+
+
+def allocate_triangles(counts, weights, target, min_triangles=MIN_TRIANGLES):
+    """
+    Spread a triangle target over meshes in proportion to their weights.
+
+    Every mesh first gets min_triangles (or all of its triangles if it has fewer), the rest of the
+    target is shared by weight; a mesh never gets more triangles than it has, what it cannot take goes
+    to the others.  If the target is below the minimums, these are scaled down instead.
+
+    Args:
+        counts (numpy.ndarray): current number of triangles of every mesh
+        weights (numpy.ndarray): importance of every mesh, e.g. its area
+        target (int): total number of triangles
+        min_triangles (int): smallest budget of a mesh
+
+    Returns:
+        budgets (numpy.ndarray): number of triangles of every mesh, at most counts, summing to at most target
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    if counts.sum() <= target:
+        return counts.astype(np.int64)
+
+    budgets = np.minimum(counts, min_triangles)
+    if budgets.sum() >= target:
+        return np.floor(budgets * target / budgets.sum()).astype(np.int64)
+
+    remaining = target - budgets.sum()
+    growing = budgets < counts
+    while remaining >= 1 and growing.any():
+        share = weights[growing] if weights[growing].sum() > 0 else counts[growing]
+        new = np.minimum(budgets[growing] + remaining * share / share.sum(), counts[growing])
+        remaining -= (new - budgets[growing]).sum()
+        budgets[growing] = new
+        growing = budgets < counts
+    return np.floor(budgets).astype(np.int64)
+
+
+def decimate_to_budget(target, min_triangles=MIN_TRIANGLES, passes=3, tolerance=0.01):
+    """
+    Decimate the scene to a triangle target, each mesh to its own share of it (see allocate_triangles,
+    weighted by area), instead of the same ratio for everything.
+
+    Every mesh is collapsed with a Decimate modifier at budget / triangles, all in one depsgraph update
+    (apply_modifier_to_meshes).  The collapse does not hit its ratio exactly, so the counts are checked
+    afterwards and meshes above their budget are decimated again, up to passes times, until the scene is
+    within tolerance of the target.
+
+    Args:
+        target (int): number of triangles of the scene, counted as in count_triangles
+        min_triangles (int): smallest budget of a mesh
+        passes (int): most decimations of a mesh
+        tolerance (float): accepted overshoot, as a fraction of the target
+
+    Returns:
+        triangles (int): number of triangles reached
+    """
+    ensure_object_mode()
+    groups = objects_by_mesh(select_all_meshes())
+    counts = np.array([mesh_triangles(group[0].data) for group in groups])
+    weights = [sum(mesh_area(obj) for obj in group) for group in groups]
+    budgets = allocate_triangles(counts, weights, target, min_triangles)
+
+    for _ in range(passes):
+        over = [i for i in range(len(groups)) if counts[i] > budgets[i]]
+        if not over or counts.sum() <= target * (1 + tolerance):
+            break
+        ratios = {groups[i][0].data.name: {'ratio': budgets[i] / counts[i]} for i in over}
+        apply_modifier_to_meshes([obj for i in over for obj in groups[i]], 'DECIMATE', ratios,
+                                 decimate_type='COLLAPSE')
+        # the meshes were replaced
+        counts = np.array([mesh_triangles(group[0].data) for group in groups])
+
+    return int(counts.sum())
+
+ 
+def check_manifold(repair, append, repair_type, use_bmesh=False):
     """
     Check whether ANY object in the file is non-manifold
 
@@ -659,19 +1005,34 @@ def check_manifold(repair, append, repair_type):
         repair (bool): whether or not to conduct repair on the mesh
         append (bool): whether or not to append results to results
         repair_type (str): type of repair to run.  Either full 3D print clean-up or simple doubles removal.
+        use_bmesh (bool): repair all non-manifold objects on their bmesh (clean_non_manifold_bmesh or
+            clean_up_bmesh) instead of selecting them one by one for the operators
 
     Returns:
        manifold_results (list of str): list of object names that are not manifold
     """
+    if use_bmesh:
+        stats = analyze_scene()
+        non_manifold = [obj for obj in select_all_meshes() if stats[obj.name]['non_manifold_edges'] != 0]
+        for obj in context.scene.objects:
+            obj.select_set(False)
+        if repair:
+            for obj in non_manifold:
+                print("%s is not manifold.  Clean-up" %obj.name)
+            if repair_type == "print":
+                edit_meshes(non_manifold, clean_non_manifold_bmesh)
+            elif repair_type == "doubles":
+                edit_meshes(non_manifold, clean_up_bmesh)
+        return [obj.name for obj in non_manifold] if append else []
+
     if repair_type != "none":
         bpy.ops.object.mode_set(mode='OBJECT')
+    stats = analyze_scene()
     objs = select_all_meshes()
     bpy.ops.object.select_all(action='DESELECT')
     manifold_results = []
     for obj in objs:
-        bm = mesh_helpers.bmesh_copy_from_object(obj, transform=False, triangulate=False)
-        edges_non_manifold = array.array('i', (i for i, ele in enumerate(bm.edges) if not ele.is_manifold))
-        if (len(edges_non_manifold)) != 0:
+        if stats[obj.name]['non_manifold_edges'] != 0:
             if append:
                 manifold_results.append(obj.name)
             if repair:
@@ -0,0 +1,115 @@
+"""
+Client of the long-running Blender worker (blender_worker.py). Plain Python, no bpy needed.
+
+Start a worker once, then glb_preprocessor.py and glb_preprocessor_all_organs.py send
+their jobs to it instead of launching Blender for every call:
+
+    python blender_client.py start [--port 50555]
+    python glb_preprocessor.py input.glb output.glb
+    python blender_client.py stop
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import time
+
+
+DEFAULT_PORT = 50555
+HOST = '127.0.0.1'
+
+
+def send(request, port=DEFAULT_PORT, timeout=None):
+    """Send one JSON request to the worker and return its JSON answer. Raises OSError if no worker listens."""
+    with socket.create_connection((HOST, port), timeout=timeout) as conn:
+        with conn.makefile('rw') as stream:
+            stream.write(json.dumps(request) + '\n')
+            stream.flush()
+            answer = stream.readline()
+    if not answer:
+        raise ConnectionError("the Blender worker closed the connection")
+    return json.loads(answer)
+
+
+def worker_running(port=DEFAULT_PORT):
+    try:
+        return send({'command': 'ping'}, port, timeout=5).get('ok', False)
+    except (OSError, ValueError):
+        return False
+
+
+def free_port():
+    """A port nobody listens on right now, for starting more workers."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def start_worker(port=DEFAULT_PORT, log_path=None, wait=120):
+    """Launch a background Blender worker on port and wait until it answers."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    log = open(log_path, 'w') if log_path else subprocess.DEVNULL
+    cmd = ['blender', '--background', '--python', 'blender_worker.py', '--', '-port', str(port)]
+    process = subprocess.Popen(cmd, cwd=here, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+    if log_path:
+        # the worker has its own handle
+        log.close()
+
+    deadline = time.time() + wait
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Blender worker exited with {}".format(process.returncode))
+        if worker_running(port):
+            return process
+        time.sleep(0.5)
+    process.kill()
+    process.wait()
+    raise RuntimeError("Blender worker did not start within {} s".format(wait))
+
+
+def stop_worker(port=DEFAULT_PORT):
+    return send({'command': 'shutdown'}, port, timeout=30)
+
+
+def process_glb(input_file_path, lods, max_triangles=None, repair_type='print', port=DEFAULT_PORT, use_bmesh=False,
+                fast_import=False, fast_export=False, lean=False, timeout=None):
+    """
+    Process one GLB file on the worker, lods and max_triangles map a level / triangle count
+    to an output file as the -lod and -max_triangles arguments do, use_bmesh, fast_import,
+    fast_export and lean as -bmesh, -fast_import, -fast_export and -lean. Returns the worker's answer,
+    {'ok': True, 'seconds': ..., 'triangles': {output file: triangles written}} or {'ok': False, 'error': traceback}.
+    With timeout, a job the worker has not answered after that many seconds raises socket.timeout.
+    """
+    # the worker runs in another directory
+    job = {
+        'input_file_path': os.path.abspath(input_file_path),
+        'lod': {str(level): os.path.abspath(path) for level, path in lods.items()},
+        'max_triangles': {str(count): os.path.abspath(path) for count, path in (max_triangles or {}).items()},
+        'repair_type': repair_type,
+        'bmesh': use_bmesh,
+        'fast_import': fast_import,
+        'fast_export': fast_export,
+        'lean': lean,
+    }
+    return send(job, port, timeout)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Start, stop or check the Blender worker')
+    parser.add_argument('command', choices=['start', 'stop', 'status'])
+    parser.add_argument('--port', type=int, help='port of the worker', default=DEFAULT_PORT)
+    parser.add_argument('--log', type=str, help='log file of a started worker', default=None)
+    args = parser.parse_args()
+
+    if args.command == 'start':
+        if worker_running(args.port):
+            print("a Blender worker is already running on port", args.port)
+        else:
+            start_worker(args.port, args.log)
+            print("Blender worker running on port", args.port)
+    elif args.command == 'stop':
+        print(stop_worker(args.port))
+    else:
+        print("running" if worker_running(args.port) else "not running")
@@ -0,0 +1,117 @@
+"""
+Long-running Blender worker.
+
+Blender is started and the add-ons are enabled once; jobs then arrive over a local
+socket, one JSON object per connection and line, and are answered with one JSON line:
+
+    {"input_file_path": "in.glb", "lod": {"100": "out.glb"}, "max_triangles": {"5000": "small.glb"},
+     "repair_type": "print", "bmesh": false, "fast_import": false,
+     "fast_export": false, "lean": false}
+    -> {"ok": true, "seconds": 12.3, "triangles": {"out.glb": 81234, "small.glb": 4987}}
+       or {"ok": false, "error": "<traceback>"}
+
+    {"command": "ping"} / {"command": "shutdown"}
+
+The scene is reset between jobs. Use blender_client.py to start it and to send jobs, or
+
+    blender --background --python blender_worker.py -- -port 50555
+"""
+
+import json
+import os
+import socket
+import sys
+import time
+import traceback
+
+cur_dir = os.getcwd()
+if not cur_dir in sys.path:
+    sys.path.append(cur_dir)
+
+from blender_client import DEFAULT_PORT, HOST
+
+
+def run_job(job):
+    from organ_preprocess_utils import process_file
+
+    input_file_path = job['input_file_path']
+    if not input_file_path.endswith('glb'):
+        raise ValueError("The 3D model is not in GLB format!")
+    if not os.path.exists(input_file_path):
+        raise ValueError(f"Input path '{input_file_path}' does not exist.")
+
+    # json keys are strings
+    levels = {int(level): path for level, path in job.get('lod', {}).items()}
+    max_tris = {int(count): path for count, path in job.get('max_triangles', {}).items()}
+    return process_file(input_file_path, job.get('repair_type', 'print'), levels, max_tris,
+                        use_bmesh=job.get('bmesh', False), fast_import=job.get('fast_import', False),
+                        fast_export=job.get('fast_export', False), lean=job.get('lean', False))
+
+
+def serve(port):
+    import bpy
+    from HuBMAP_reduction import enable_addons, clean_scene, ensure_object_mode
+    enable_addons()
+
+    def reset_scene():
+        # drop the objects and data of a job before the next one; a job that failed in edit mode
+        # is left there, where clean_scene's operators cannot run
+        try:
+            ensure_object_mode()
+            clean_scene()
+        except Exception:
+            print(traceback.format_exc(), flush=True)
+            # start over from an empty scene rather than keep a stale one for every later job
+            bpy.ops.wm.read_factory_settings(use_empty=True)
+            enable_addons()
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((HOST, port))
+    server.listen()
+    print("Blender worker listening on {}:{}".format(HOST, port), flush=True)
+
+    # bpy is not thread safe, jobs run one after the other on the main thread
+    running = True
+    while running:
+        conn, _ = server.accept()
+        with conn, conn.makefile('rw') as stream:
+            try:
+                job = json.loads(stream.readline())
+                if not isinstance(job, dict):
+                    raise ValueError("expected a JSON object, got {}".format(type(job).__name__))
+            except ValueError as e:
+                answer = {'ok': False, 'error': "invalid request: {}".format(e)}
+            else:
+                command = job.get('command')
+                if command == 'ping':
+                    answer = {'ok': True}
+                elif command == 'shutdown':
+                    answer = {'ok': True}
+                    running = False
+                else:
+                    start = time.time()
+                    print("job: {}".format(job), flush=True)
+                    try:
+                        triangles = run_job(job)
+                        answer = {'ok': True, 'seconds': time.time() - start, 'triangles': triangles}
+                    except Exception:
+                        answer = {'ok': False, 'error': traceback.format_exc()}
+                        print(answer['error'], flush=True)
+                    try:
+                        reset_scene()
+                    except Exception:
+                        print(traceback.format_exc(), flush=True)
+            try:
+                stream.write(json.dumps(answer) + '\n')
+                stream.flush()
+            except OSError:
+                # the client went away, keep serving
+                pass
+    server.close()
+
+
+if __name__ == "__main__":
+    from my_argparser import MyArgParser
+    port = MyArgParser().port
+    serve(port if port is not None else DEFAULT_PORT)
@@ -1,15 +1,40 @@
 import argparse
 import subprocess
 
+from blender_client import DEFAULT_PORT, process_glb, worker_running
+
 
 parser = argparse.ArgumentParser(description='Python wrapper for Blender')
 parser.add_argument('input_glb_path', help='input glb file path')
 parser.add_argument('output_glb_path', help='output glb file path')
+parser.add_argument('--port', type=int, help='port of a running Blender worker (blender_client.py start)', default=DEFAULT_PORT)
+parser.add_argument('--bmesh', action='store_true', help='repair and decimate on the mesh data instead of through Blender operators')
+parser.add_argument('--fast_import', action='store_true', help='import the geometry only, with NumPy instead of the stock glTF importer')
+parser.add_argument('--fast_export', action='store_true', help='write the GLB from NumPy buffers instead of with the stock glTF exporter')
+parser.add_argument('--lean', action='store_true', help='geometry work only, no render, lighting or camera setup')
 args = parser.parse_args()
 
 input_glb_path = args.input_glb_path
 output_glb_path = args.output_glb_path
 
-cmd = ['blender', '--background', '--python', 'single_organ_preprocess.py', '--', '-input_file_path', input_glb_path, '-lod', '100', output_glb_path]
+if worker_running(args.port):
+    # the worker already has Blender and the add-ons loaded
+    answer = process_glb(input_glb_path, {100: output_glb_path}, port=args.port, use_bmesh=args.bmesh,
+                         fast_import=args.fast_import, fast_export=args.fast_export, lean=args.lean)
+    if not answer['ok']:
+        print(answer['error'])
+        exit(1)
+    for path, triangles in answer.get('triangles', {}).items():
+        print("{}: {} triangles".format(path, triangles))
+else:
+    cmd = ['blender', '--background', '--python', 'single_organ_preprocess.py', '--', '-input_file_path', input_glb_path, '-lod', '100', output_glb_path]
+    if args.bmesh:
+        cmd.append('-bmesh')
+    if args.fast_import:
+        cmd.append('-fast_import')
+    if args.fast_export:
+        cmd.append('-fast_export')
+    if args.lean:
+        cmd.append('-lean')
 
-subprocess.run(cmd)
+    subprocess.run(cmd)
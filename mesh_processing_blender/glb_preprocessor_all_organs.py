@@ -1,9 +1,18 @@
 import os
+import sys
 import json
+import time
+import socket
 import argparse
+import threading
 import subprocess
 import requests
 
+# the downloader is shared with the CGAL stage
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mesh_processing_cgal'))
+from glb_downloader import download_files
+from blender_client import DEFAULT_PORT, free_port, process_glb, start_worker, stop_worker, worker_running
+
 
 # Naive Hashing for url
 def convert_url_to_file(url):
@@ -16,7 +25,7 @@ def convert_url_to_file(url):
     return url
 
 # Get the latest version models
-def download_model(api_url, output_folder):
+def download_model(api_url, output_folder, jobs=8, revalidate=True):
     """A function to get download URLs for all 3D Reference Objects in the HRA
     """
 
@@ -28,23 +37,138 @@ def download_model(api_url, output_folder):
     os.makedirs(output_folder, exist_ok=True)
 
     # Get download URLs
+    tasks = []
     for organ in data:
         glb_url = organ['object']['file']
-        file_name = convert_url_to_file(glb_url)
-        file_path = os.path.join(output_folder, file_name)
-        
-        # Already downloaded, skip it. 
-        if os.path.exists(file_path):
-            continue
-        
         if glb_url:
-            glb_response = requests.get(glb_url)
-            
-            # Download model
-            if glb_response.status_code == 200:
-                with open(file_path, "wb") as file:
-                    file.write(glb_response.content)
-                    print(f"Downloaded {file_name}")
+            tasks.append((glb_url, os.path.join(output_folder, convert_url_to_file(glb_url))))
+
+    return download_files(tasks, jobs, revalidate=revalidate)
+
+
+def process_with_worker(input_model_dir, output_model_dir, port=DEFAULT_PORT, **options):
+    """
+    Same as all_organs_preprocess.py, with the jobs sent to a running Blender worker.
+    options are passed on to blender_client.process_glb (use_bmesh, fast_import, fast_export, lean).
+    """
+    os.makedirs(output_model_dir, exist_ok=True)
+    for file in sorted(os.listdir(input_model_dir)):
+        if not file.endswith('.glb'):
+            continue
+        output_path = os.path.join(output_model_dir, file)
+        if os.path.exists(output_path):
+            continue
+
+        answer = process_glb(os.path.join(input_model_dir, file), {100: output_path}, port=port, **options)
+        if answer['ok']:
+            print("processed {} in {:.1f} s".format(file, answer['seconds']))
+        else:
+            print("failed to process {}:\n{}".format(file, answer['error']))
+
+
+def process_with_pool(input_model_dir, output_model_dir, workers, log_dir, retries=1, job_timeout=None, **options):
+    """
+    Process the GLB files of input_model_dir with a pool of background Blender workers.
+
+    Every worker takes the largest file left when it becomes free and logs to
+    log_dir/worker_<i>.log. A file whose job fails, or whose worker crashes, is put
+    back for another try, up to retries times; a crashed worker is restarted. A job
+    that takes longer than job_timeout seconds counts as a crash: its worker is killed
+    and restarted and the file is tried again the same way. options are passed on to
+    blender_client.process_glb.
+    """
+    os.makedirs(output_model_dir, exist_ok=True)
+    os.makedirs(log_dir, exist_ok=True)
+    files = [file for file in os.listdir(input_model_dir)
+             if file.endswith('.glb') and not os.path.exists(os.path.join(output_model_dir, file))]
+    sizes = {file: os.path.getsize(os.path.join(input_model_dir, file)) for file in files}
+    pending = sorted(files, key=sizes.get, reverse=True)
+    attempts = {file: 0 for file in files}
+    failed = {}
+    lock = threading.Lock()
+
+    def next_file():
+        with lock:
+            return pending.pop(0) if pending else None
+
+    def reap(process):
+        # kill the worker if it still runs and wait for it, so no zombie is left behind
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+
+    def run(i):
+        log_path = os.path.join(log_dir, 'worker_{}.log'.format(i))
+        port = free_port()
+        try:
+            process = start_worker(port, log_path)
+        except (RuntimeError, OSError) as e:
+            print("worker {} did not start: {}".format(i, e))
+            return
+
+        file = next_file()
+        while file is not None:
+            output_path = os.path.join(output_model_dir, file)
+            crashed = False
+            try:
+                answer = process_glb(os.path.join(input_model_dir, file), {100: output_path}, port=port,
+                                     timeout=job_timeout, **options)
+            except socket.timeout:
+                answer = {'ok': False, 'error': "worker {} timed out after {} s".format(i, job_timeout)}
+                crashed = True
+            except (OSError, ValueError) as e:
+                answer = {'ok': False, 'error': "worker {} crashed: {}".format(i, e)}
+                crashed = True
+
+            if answer['ok']:
+                print("worker {}: processed {} in {:.1f} s".format(i, file, answer['seconds']))
+            else:
+                with lock:
+                    attempts[file] += 1
+                    if attempts[file] <= retries:
+                        # back in the list, largest first
+                        pending.append(file)
+                        pending.sort(key=sizes.get, reverse=True)
+                    else:
+                        failed[file] = answer['error']
+                print("worker {}: failed to process {} (attempt {})".format(i, file, attempts[file]))
+
+            if crashed:
+                # a hung worker is killed; the log of the old worker is kept next to the new one
+                reap(process)
+                os.replace(log_path, log_path + '.crashed')
+                port = free_port()
+                try:
+                    process = start_worker(port, log_path)
+                except (RuntimeError, OSError) as e:
+                    print("worker {} did not restart: {}".format(i, e))
+                    return
+            file = next_file()
+
+        try:
+            stop_worker(port)
+            process.wait(timeout=60)
+        except (OSError, ValueError, subprocess.TimeoutExpired) as e:
+            print("worker {} did not stop: {}".format(i, e))
+        reap(process)
+
+    start = time.time()
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(min(workers, len(files)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # files left when every worker failed to start
+    for file in pending:
+        failed.setdefault(file, "no worker left")
+
+    print("{} workers processed {} of {} models in {:.1f} s".format(
+        len(threads), len(files) - len(failed), len(files), time.time() - start))
+    for file in sorted(failed):
+        print("***************************************")
+        print("failed to process {}:\n{}".format(file, failed[file]))
+    return failed
 
 
 if __name__ == "__main__":
@@ -58,8 +182,31 @@ if __name__ == "__main__":
                         help="URL of the API", default=endpoint)
     parser.add_argument("--downloaded_dir", type=str,
                         help="Folder to save downloaded GLB files", default="downloaded_organs/")
+    parser.add_argument("--download_jobs", type=int,
+                        help="Number of concurrent GLB downloads", default=8)
+    parser.add_argument("--no_revalidate", action="store_true",
+                        help="Skip GLB files that are already downloaded instead of checking them for changes")
     parser.add_argument("--output_glb_model_dir", type=str,
                         help="Directory to the preprocessed GLB models", default="../all_preprocessed_glb_models/")
+    parser.add_argument("--workers", type=int,
+                        help="Number of background Blender processes working on the models in parallel", default=0)
+    parser.add_argument("--log_dir", type=str,
+                        help="With --workers, directory of the log file of every Blender process", default="blender_logs/")
+    parser.add_argument("--retries", type=int,
+                        help="With --workers, number of times a failed model is tried again", default=1)
+    parser.add_argument("--job_timeout", type=float,
+                        help="With --workers, seconds after which a model fails and its Blender process is restarted",
+                        default=3600)
+    parser.add_argument("--bmesh", action="store_true",
+                        help="Repair and decimate on the mesh data instead of through Blender operators")
+    parser.add_argument("--fast_import", action="store_true",
+                        help="Import the geometry only, with NumPy instead of the stock glTF importer")
+    parser.add_argument("--fast_export", action="store_true",
+                        help="Write the GLB files from NumPy buffers instead of with the stock glTF exporter")
+    parser.add_argument("--lean", action="store_true",
+                        help="Geometry work only, without the render, lighting and camera setup")
+    parser.add_argument("--port", type=int,
+                        help="Port of a running Blender worker (blender_client.py start)", default=DEFAULT_PORT)
     # parser.add_argument("--output_off_model_dir", type=str,
     #                     help="Directory to the preprocessed OFF models", default="all_preprocessed_off_models/")
     args, unknown = parser.parse_known_args()
@@ -67,14 +214,29 @@ if __name__ == "__main__":
     # Download undownloaded models 
     api_url = args.url
     downloaded_dir = args.downloaded_dir
-    download_model(api_url, downloaded_dir)
+    download_model(api_url, downloaded_dir, args.download_jobs, revalidate=not args.no_revalidate)
 
     # The input_model_directory is the downloaded model directory, the output_model_directory is specified by users.  
     input_model_dir = downloaded_dir
     output_glb_model_dir = args.output_glb_model_dir
 
-    cmd1 = ['blender', '--background', '--python', 'all_organs_preprocess.py', '--', '-input_model_dir', input_model_dir, '-output_model_dir', output_glb_model_dir]
-    print(' '.join(cmd1))
-    subprocess.run(cmd1)
+    options = {'use_bmesh': args.bmesh, 'fast_import': args.fast_import, 'fast_export': args.fast_export, 'lean': args.lean}
+    if args.workers > 0:
+        process_with_pool(input_model_dir, output_glb_model_dir, args.workers, args.log_dir, args.retries,
+                          args.job_timeout, **options)
+    elif worker_running(args.port):
+        process_with_worker(input_model_dir, output_glb_model_dir, args.port, **options)
+    else:
+        cmd1 = ['blender', '--background', '--python', 'all_organs_preprocess.py', '--', '-input_model_dir', input_model_dir, '-output_model_dir', output_glb_model_dir]
+        if args.bmesh:
+            cmd1.append('-bmesh')
+        if args.fast_import:
+            cmd1.append('-fast_import')
+        if args.fast_export:
+            cmd1.append('-fast_export')
+        if args.lean:
+            cmd1.append('-lean')
+        print(' '.join(cmd1))
+        subprocess.run(cmd1)
 
 
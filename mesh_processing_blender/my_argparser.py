@@ -11,6 +11,11 @@ class MyArgParser:
         self.input_file_path = ""
         self.input_model_dir = ""
         self.output_model_dir = ""
+        self.port = None
+        self.use_bmesh = False
+        self.fast_import = False
+        self.fast_export = False
+        self.lean = False
         self.parse()
 
 
@@ -41,6 +46,17 @@ class MyArgParser:
                 elif self.argv[index] == '-output_model_dir':
                     self.output_model_dir = self.argv[index + 1]
                     index += 1
+                elif self.argv[index] == '-bmesh':
+                    self.use_bmesh = True
+                elif self.argv[index] == '-fast_import':
+                    self.fast_import = True
+                elif self.argv[index] == '-fast_export':
+                    self.fast_export = True
+                elif self.argv[index] == '-lean':
+                    self.lean = True
+                elif self.argv[index] == '-port':
+                    self.port = int(self.argv[index + 1])
+                    index += 1
                 index += 1
         except ValueError:
             print("please check arguments!")
@@ -0,0 +1,332 @@
+"""
+Fast GLB import and export for the repair pipeline, as an alternative to
+bpy.ops.import_scene.gltf and bpy.ops.export_scene.gltf.
+
+Only what the repair and export steps need is imported: node names, hierarchy and
+transforms, and the triangles of every mesh.  Accessors are decoded with pygltflib and
+NumPy (the glb_reader / glb_accessor modules of the CGAL stage) and the meshes are built
+with foreach_set.  Materials, normals, UVs and other attributes are not imported.
+
+GLBExporter writes the scene back the other way: positions, vertex normals and triangles
+are read with foreach_get and written from NumPy buffers with pygltflib, with the base
+color, metallic and roughness of the materials.  Nodes, names and materials are collected
+once per model, so several LOD levels can be written without walking the scene again.
+
+Object and mesh names, parenting, instancing (nodes sharing a mesh) and the Y-up / Z-up
+conversion follow the stock importer and exporter, so the models export the same way.
+"""
+
+import os
+import sys
+
+import bpy
+import numpy as np
+import pygltflib
+from mathutils import Matrix, Quaternion, Vector
+
+# the GLB decoding is shared with the CGAL stage
+cgal_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mesh_processing_cgal')
+if not cgal_dir in sys.path:
+    sys.path.append(cgal_dir)
+
+from glb_reader import GLBReader
+
+
+# glTF is +Y up, Blender +Z up: (x, y, z) -> (x, -z, y), as the stock importer converts by default
+Y_UP_TO_Z_UP = Matrix(((1, 0, 0, 0), (0, 0, -1, 0), (0, 1, 0, 0), (0, 0, 0, 1)))
+
+
+def convert_points(points):
+    points = np.asarray(points, dtype=np.float32)
+    return np.stack([points[:, 0], -points[:, 2], points[:, 1]], axis=1)
+
+
+def export_points(points):
+    """Inverse of convert_points, Blender (x, y, z) -> glTF (x, z, -y)"""
+    points = np.asarray(points, dtype=np.float32)
+    return np.stack([points[:, 0], points[:, 2], -points[:, 1]], axis=1)
+
+
+def node_matrix(node):
+    """Local matrix of a glTF node in Blender coordinates"""
+    if node.matrix is not None:
+        # glTF matrices are column major
+        matrix = Matrix([node.matrix[i::4] for i in range(4)])
+        return Y_UP_TO_Z_UP @ matrix @ Y_UP_TO_Z_UP.inverted()
+
+    location, rotation, scale = Vector(), Quaternion(), Vector((1, 1, 1))
+    if node.translation is not None:
+        x, y, z = node.translation
+        location = Vector((x, -z, y))
+    if node.rotation is not None:
+        x, y, z, w = node.rotation
+        rotation = Quaternion((w, x, -z, y))
+    if node.scale is not None:
+        x, y, z = node.scale
+        scale = Vector((x, z, y))
+    return Matrix.Translation(location) @ rotation.to_matrix().to_4x4() @ Matrix.Diagonal(scale).to_4x4()
+
+
+def create_mesh(name, points, triangles):
+    """
+    Build a Blender mesh from (n, 3) points in glTF coordinates and (m, 3) triangle indices.
+
+    Returns:
+        mesh (bpy.types.Mesh): the new mesh
+    """
+    co = convert_points(points)
+    triangles = np.ascontiguousarray(triangles, dtype=np.int32)
+
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(co))
+    mesh.vertices.foreach_set('co', co.ravel())
+    mesh.loops.add(triangles.size)
+    mesh.loops.foreach_set('vertex_index', triangles.ravel())
+    mesh.polygons.add(len(triangles))
+    mesh.polygons.foreach_set('loop_start', np.arange(0, triangles.size, 3, dtype=np.int32))
+    if bpy.app.version < (4, 0, 0):
+        # computed from loop_start since Blender 4.0
+        mesh.polygons.foreach_set('loop_total', np.full(len(triangles), 3, dtype=np.int32))
+    mesh.update(calc_edges=True)
+    # drops degenerate triangles, which the operators do not expect
+    mesh.validate()
+    return mesh
+
+
+def import_glb(file_path, collection=None):
+    """
+    Import the default scene of a GLB file into collection (the active collection by default).
+
+    Args:
+        file_path (str): path of the GLB file
+        collection (bpy.types.Collection): collection the new objects are linked to
+
+    Returns:
+        objects (list of bpy_types.Object): the new objects, parents before children
+    """
+    collection = collection or bpy.context.collection
+    objects = []
+
+    with GLBReader(file_path) as reader:
+        gltf = reader.gltf
+        meshes = {}
+
+        def get_mesh(index):
+            # nodes using the same glTF mesh share one Blender mesh
+            if index not in meshes:
+                points, triangles = reader.mesh_arrays(index)
+                meshes[index] = create_mesh(gltf.meshes[index].name or 'Mesh_%d' % index, points, triangles)
+            return meshes[index]
+
+        def add_node(index, parent):
+            node = gltf.nodes[index]
+            data = get_mesh(node.mesh) if node.mesh is not None else None
+            obj = bpy.data.objects.new(node.name or 'Node_%d' % index, data)
+            collection.objects.link(obj)
+            obj.parent = parent
+            obj.matrix_basis = node_matrix(node)
+            objects.append(obj)
+            for child in node.children or []:
+                add_node(child, obj)
+
+        if gltf.scenes:
+            roots = gltf.scenes[gltf.scene or 0].nodes or []
+        else:
+            children = {child for node in gltf.nodes for child in node.children or []}
+            roots = [i for i in range(len(gltf.nodes)) if i not in children]
+        for root in roots:
+            add_node(root, None)
+
+    return objects
+
+
+def node_trs(matrix):
+    """glTF translation, rotation and scale of a local matrix in Blender coordinates, as the stock exporter writes them"""
+    location, rotation, scale = matrix.decompose()
+    trs = {}
+    if location.length > 0:
+        trs['translation'] = [location.x, location.z, -location.y]
+    if rotation != Quaternion():
+        trs['rotation'] = [rotation.x, rotation.z, -rotation.y, rotation.w]
+    if scale != Vector((1, 1, 1)):
+        trs['scale'] = [scale.x, scale.z, scale.y]
+    return trs
+
+
+def material_values(material):
+    """glTF PBR values of a material, from its Principled BSDF node or else its viewport settings"""
+    color, metallic, roughness = list(material.diffuse_color), material.metallic, material.roughness
+    if material.use_nodes and material.node_tree:
+        for node in material.node_tree.nodes:
+            if node.type == 'BSDF_PRINCIPLED':
+                color = list(node.inputs['Base Color'].default_value)
+                color[3] = node.inputs['Alpha'].default_value
+                metallic = node.inputs['Metallic'].default_value
+                roughness = node.inputs['Roughness'].default_value
+                break
+    values = pygltflib.Material(
+        name=material.name,
+        pbrMetallicRoughness=pygltflib.PbrMetallicRoughness(
+            baseColorFactor=[float(c) for c in color], metallicFactor=float(metallic),
+            roughnessFactor=float(roughness)),
+        doubleSided=not material.use_backface_culling,
+    )
+    if color[3] < 1:
+        values.alphaMode = pygltflib.BLEND
+    return values
+
+
+def mesh_buffers(mesh):
+    """
+    Geometry of a mesh read with foreach_get, in glTF coordinates.
+
+    Returns:
+        points (numpy.ndarray): (n, 3) float32 positions
+        normals (numpy.ndarray): (n, 3) float32 vertex normals
+        triangles (numpy.ndarray): (m, 3) uint32 vertex indices
+        material_indices (numpy.ndarray): (m,) material slot of every triangle
+    """
+    mesh.calc_loop_triangles()
+    points = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', points)
+    normals = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get('normal', normals)
+    triangles = np.empty(len(mesh.loop_triangles) * 3, dtype=np.uint32)
+    mesh.loop_triangles.foreach_get('vertices', triangles)
+    material_indices = np.empty(len(mesh.loop_triangles), dtype=np.int32)
+    mesh.loop_triangles.foreach_get('material_index', material_indices)
+    return (export_points(points.reshape(-1, 3)), export_points(normals.reshape(-1, 3)), triangles.reshape(-1, 3),
+            material_indices)
+
+
+class GLBExporter:
+    """
+    Writes the mesh and empty objects of the scene to GLB files without bpy.ops.export_scene.gltf.
+
+    The nodes (names, hierarchy, transforms) are collected when the exporter is created; the
+    geometry is read again on every write, so one exporter writes all LOD levels of a model
+    while the meshes are decimated in between:
+
+        exporter = GLBExporter()
+        for level, path in levels:
+            decimate(...)
+            exporter.write(path)
+
+    Like the stock exporter with its default settings, modifiers are not applied and cameras
+    and lights are skipped.  Meshes without triangles are written as nodes without a mesh.
+    """
+
+    def __init__(self, objects=None):
+        if objects is None:
+            objects = [obj for obj in bpy.context.scene.objects if obj.type in ('MESH', 'EMPTY')]
+        self.objects = list(objects)
+        index = {obj.name: i for i, obj in enumerate(self.objects)}
+
+        self.nodes = []
+        self.roots = []
+        for i, obj in enumerate(self.objects):
+            parent = obj.parent if obj.parent is not None and obj.parent.name in index else None
+            # the parent inverse matrix is folded into the local transform
+            matrix = obj.matrix_world if parent is None else parent.matrix_world.inverted() @ obj.matrix_world
+            self.nodes.append(dict(name=obj.name, **node_trs(matrix)))
+            if parent is None:
+                self.roots.append(i)
+        for i, obj in enumerate(self.objects):
+            children = [index[child.name] for child in obj.children if child.name in index]
+            if children:
+                self.nodes[i]['children'] = children
+        # glTF materials by name, converted once; material_indices maps them to the document being built
+        self.materials = {}
+        self.material_indices = {}
+
+    def material_index(self, material, gltf):
+        if material.name not in self.materials:
+            self.materials[material.name] = material_values(material)
+        if material.name not in self.material_indices:
+            self.material_indices[material.name] = len(gltf.materials)
+            gltf.materials.append(self.materials[material.name])
+        return self.material_indices[material.name]
+
+    def build(self):
+        """The glTF document and the binary blob of the current scene."""
+        # edit mode changes are written to the mesh data when leaving edit mode
+        if bpy.context.object is not None and bpy.context.object.mode != 'OBJECT':
+            bpy.ops.object.mode_set(mode='OBJECT')
+
+        gltf = pygltflib.GLTF2(asset=pygltflib.Asset(generator='HRA numpy_gltf'), scene=0)
+        chunks = []
+        offset = 0
+        self.material_indices = {}
+
+        def add_view(array, target):
+            nonlocal offset
+            data = np.ascontiguousarray(array).tobytes()
+            gltf.bufferViews.append(pygltflib.BufferView(buffer=0, byteOffset=offset, byteLength=len(data),
+                                                         target=target))
+            # accessors must start on a multiple of their component size
+            padding = -len(data) % 4
+            chunks.append(data + b'\0' * padding)
+            offset += len(data) + padding
+            return len(gltf.bufferViews) - 1
+
+        def add_accessor(array, component_type, accessor_type, target, bounds=False):
+            accessor = pygltflib.Accessor(bufferView=add_view(array, target), componentType=component_type,
+                                          count=len(array), type=accessor_type)
+            if bounds:
+                accessor.min = array.min(axis=0).tolist()
+                accessor.max = array.max(axis=0).tolist()
+            gltf.accessors.append(accessor)
+            return len(gltf.accessors) - 1
+
+        meshes = {}
+        nodes = []
+        for obj, node in zip(self.objects, self.nodes):
+            node = pygltflib.Node(**node)
+            nodes.append(node)
+            if obj.type != 'MESH':
+                continue
+            # objects sharing a mesh share the glTF mesh too
+            if obj.data.name not in meshes:
+                meshes[obj.data.name] = self.add_mesh(obj.data, gltf, add_accessor)
+            node.mesh = meshes[obj.data.name]
+        gltf.nodes = nodes
+        gltf.scenes = [pygltflib.Scene(name=bpy.context.scene.name, nodes=self.roots)]
+
+        blob = b''.join(chunks)
+        gltf.buffers = [pygltflib.Buffer(byteLength=len(blob))]
+        gltf.set_binary_blob(blob)
+        return gltf
+
+    def add_mesh(self, mesh, gltf, add_accessor):
+        points, normals, triangles, material_indices = mesh_buffers(mesh)
+        if not len(triangles):
+            return None
+
+        position = add_accessor(points, pygltflib.FLOAT, pygltflib.VEC3, pygltflib.ARRAY_BUFFER, bounds=True)
+        normal = add_accessor(normals, pygltflib.FLOAT, pygltflib.VEC3, pygltflib.ARRAY_BUFFER)
+        if len(points) <= 0xFFFF:
+            index_type, component_type = np.uint16, pygltflib.UNSIGNED_SHORT
+        else:
+            index_type, component_type = np.uint32, pygltflib.UNSIGNED_INT
+
+        # one primitive per material slot in use
+        primitives = []
+        materials = mesh.materials
+        for slot in np.unique(material_indices):
+            indices = triangles[material_indices == slot].astype(index_type).ravel()
+            primitive = pygltflib.Primitive(
+                attributes=pygltflib.Attributes(POSITION=position, NORMAL=normal),
+                indices=add_accessor(indices, component_type, pygltflib.SCALAR, pygltflib.ELEMENT_ARRAY_BUFFER))
+            if slot < len(materials) and materials[slot] is not None:
+                primitive.material = self.material_index(materials[slot], gltf)
+            primitives.append(primitive)
+
+        gltf.meshes.append(pygltflib.Mesh(name=mesh.name, primitives=primitives))
+        return len(gltf.meshes) - 1
+
+    def write(self, *file_paths):
+        """Write the current scene to one or more GLB files; the geometry is read once for all of them."""
+        data = b''.join(self.build().save_to_bytes())
+        for file_path in file_paths:
+            with open(file_path, 'wb') as f:
+                f.write(data)
@@ -31,8 +31,9 @@ from HuBMAP_reduction import FileLocations
 from HuBMAP_reduction import import_files, convert_time, generate_outputs
 from HuBMAP_reduction import clean_scene, setup_scene, enable_addons
 from HuBMAP_reduction import select_all_meshes, add_edgesplit_modifier
-from HuBMAP_reduction import count_polys, check_manifold
+from HuBMAP_reduction import count_polys, check_manifold, ensure_object_mode
 from HuBMAP_reduction import decimate, analyze_mesh
+from HuBMAP_reduction import count_triangles, decimate_to_budget
 from my_argparser import MyArgParser
 
 
@@ -49,21 +50,39 @@ def setup_logging(output_root):
     logging.basicConfig(filename=log_location, encoding='utf-8', level=logging.DEBUG)
 
 
-def generate_output_LOD(lod, output_filepath, file_locations):
+def generate_output_LOD(lod, output_filepath, file_locations, exporter=None, lean=False):
+    """
+    Export the current scene as one LOD level.
+
+    Args:
+        lod (int): LOD level
+        output_filepath (str): path of the GLB file
+        file_locations (object): an object containing urls and filenames for inputs and outputs
+        exporter (numpy_gltf.GLBExporter): write the GLB with this exporter instead of bpy.ops.export_scene.gltf
+        lean (bool): there is no camera to frame, only leave edit mode and select the meshes again for the next level
+    """
 
-    #orient the camera to frame the mesh
-    bpy.ops.object.mode_set(mode='OBJECT')
-    select_all_meshes()
-    bpy.ops.view3d.camera_to_view_selected()
+    if lean:
+        ensure_object_mode()
+        select_all_meshes()
+    else:
+        #orient the camera to frame the mesh
+        bpy.ops.object.mode_set(mode='OBJECT')
+        select_all_meshes()
+        bpy.ops.view3d.camera_to_view_selected()
 
     output_dir = os.path.dirname(output_filepath)
-    if not os.path.exists(output_dir):
+    if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
+    if exporter is not None:
+        exporter.write(output_filepath)
+        return
     bpy.ops.export_scene.gltf(filepath=output_filepath[:-4], export_format='GLB', export_cameras=False)
 
 
-def mesh_process(file_locations, repair_type, levels, max_tris):
+def mesh_process(file_locations, repair_type, levels, max_tris, use_bmesh=False, fast_import=False, fast_export=False,
+                 lean=False):
     """
     This is the main mesh processing script.  It will run through a series of steps:
 
@@ -72,30 +91,40 @@ def mesh_process(file_locations, repair_type, levels, max_tris):
     3.  Set up the Blender Scene (Cameras, lighting etc.)
     4.  Analyze the mesh to identify it's attributes
     5.  Reset the pivot points for all mesh and group objects
-    6.  Iteratively generate LOD models through decimation
-    6.  Generate output files and renders for each LOD as it is generated
+    6.  Iteratively generate LOD models through decimation, the -lod levels as a percentage of the whole
+        scene, the -max_triangles targets with a triangle budget per object (decimate_to_budget)
+    7.  Generate output files and renders for each LOD as it is generated
 
     Args:
         file_locations (object): an object containing urls and filenames for inputs and outputs
+        use_bmesh (bool): run decimation and repairs on the mesh data of all objects at once instead of
+            through operators, see HuBMAP_reduction.apply_modifier_to_meshes and edit_meshes
+        fast_import (bool): import the geometry only, with numpy_gltf instead of the stock glTF importer
+        fast_export (bool): write the LOD files with numpy_gltf.GLBExporter instead of the stock glTF exporter
+        lean (bool): geometry work only, skip step 3 (render engine, HDR lighting and camera) since nothing is rendered
+
+    Returns:
+        triangles (dict): output filename -> number of triangles written to it
     """
     #start a timer for the process
     start_time = time.time()
    
     #import the source file
     print("Import File: %s" %file_locations.filename)
-    import_files(file_locations)
+    import_files(file_locations, fast_import)
     
     #setup the Blender scene
     objs = select_all_meshes()
-    print("Setup scene...")
-    setup_scene(file_locations.hdr)
+    if not lean:
+        print("Setup scene...")
+        setup_scene(file_locations.hdr)
 
     #add edge split to harden edges
-    add_edgesplit_modifier()
+    add_edgesplit_modifier(use_bmesh)
 
     #analyze the mesh to determine the attributes of the input file
     #We should return this values as attributes of the input file when integrated into the NIH 3D workflows.
-    polys, verts, manifold, intersections = analyze_mesh(True, repair_type)
+    polys, verts, manifold, intersections = analyze_mesh(True, repair_type, use_bmesh)
     
     print("Analyze mesh...")
     print("Starting Polys: %s" %polys)
@@ -103,36 +132,106 @@ def mesh_process(file_locations, repair_type, levels, max_tris):
     print("Non-Manifold Objects: %s" %manifold)
     print("Objects with self-intersections: %s" %intersections)
     
-    for max_tri, output_filepath in max_tris.items():
-        approximate_lod = min(100, int(max_tri / polys * 100))
-        levels[approximate_lod] = output_filepath
-        
     #create lod models
     objs = select_all_meshes()
 
     bpy.context.view_layer.objects.active = objs[0]
     
     print("Create preprocessed models")
-    levels = sorted(levels.items(), reverse=True)
+    # one decimation sequence from the largest output to the smallest, lod levels and triangle targets mixed
+    start_triangles = count_triangles()
+    outputs = [(start_triangles * level / 100.0, level, None, path) for level, path in levels.items()]
+    outputs += [(max_tri, None, max_tri, path) for max_tri, path in max_tris.items()]
+    outputs.sort(key=lambda output: output[0], reverse=True)
     prev_level = 100.0
-
-    for level, output_filepath in levels:
-        ratio = level / prev_level
-        prev_level = level
-        decimate(ratio)
+    triangles = {}
+
+    # the nodes are collected once, only the geometry is read again for every level
+    exporter = None
+    if fast_export:
+        from numpy_gltf import GLBExporter
+        exporter = GLBExporter()
+
+    for _, level, max_tri, output_filepath in outputs:
+        if max_tri is None:
+            # a larger triangle target may already have gone below this level
+            if level < prev_level:
+                decimate(level / prev_level, use_bmesh)
+                prev_level = level
+        else:
+            reached = decimate_to_budget(max_tri)
+            prev_level = min(prev_level, 100.0 * reached / max(start_triangles, 1))
         verts, polys = count_polys()
         #check for and repair manifold errors
-        manifold = check_manifold(True, False, repair_type)
+        manifold = check_manifold(True, False, repair_type, use_bmesh)
         
         #define the output formats for specific input types depending on their source and attributes.  Will output glb by default.
         print("output files...")
-        generate_output_LOD(level, output_filepath, file_locations)
+        generate_output_LOD(level, output_filepath, file_locations, exporter, lean)
+
+        # the repairs can add triangles again, count what was written
+        triangles[output_filepath] = count_triangles()
+        target = "%s%%" % level if max_tri is None else "%s triangles" % max_tri
+        print("%s: %s triangles (target %s)" % (output_filepath, triangles[output_filepath], target))
+        logging.info("%s: %s triangles (target %s)" % (output_filepath, triangles[output_filepath], target))
         
         
     #reporting of elapsed time for mesh processing.
     end_time = time.time()
     elapsed_time = end_time - start_time
     logging.info("process completed in %s" %convert_time(elapsed_time))
+    return triangles
+
+
+def process_file(source_path, repair_type, levels, max_tris, hdr="./studio_small_01_4k.exr", use_bmesh=False,
+                 fast_import=False, fast_export=False, lean=False):
+    """
+    Resets the scene and processes one GLB file into the outputs given by levels and max_tris.
+    Shared by single_organ_process, all_organ_process and the Blender worker (blender_worker.py).
+
+    Args:
+        source_path (str): path of the input GLB file
+        repair_type (str): "print" or "doubles", see single_organ_process
+        levels (dict): lod -> output filename
+        max_tris (dict): max_triangle -> output filename
+        hdr (str): path of the hdr image used to light the scene
+        use_bmesh (bool): use the operator-free path, see mesh_process
+        fast_import (bool): use the NumPy glTF importer, see mesh_process
+        fast_export (bool): use the NumPy GLB writer, see mesh_process
+        lean (bool): no camera, lighting or render setup, see mesh_process
+
+    Returns:
+        triangles (dict): output filename -> number of triangles, see mesh_process
+    """
+    #remove default objects and create new camera
+    clean_scene()
+    if not lean:
+        camera_data = bpy.data.cameras.new(name='Camera')
+        camera_object = bpy.data.objects.new('Camera', camera_data)
+        bpy.context.scene.collection.objects.link(camera_object)
+        bpy.context.scene.camera = camera_object
+
+    split_path = os.path.splitext(source_path)
+    
+    #extension for the source file
+    extension = split_path[1]
+    
+    #store the filename without the extension
+    filestem = os.path.split(split_path[0])[1]
+    
+    #store the complete filename
+    filename = filestem + extension
+    
+    #output directory for output files (testing only)
+
+    # output_dir = output_root
+    # no need to specify output directory, which is given by the command arguments. 
+    output_dir = ""
+    output_root = ""
+
+    file_locations = FileLocations(filename, filestem, extension, source_path, output_dir, output_root, hdr)
+
+    return mesh_process(file_locations, repair_type, levels, max_tris, use_bmesh, fast_import, fast_export, lean)
 
 
 def single_organ_process(repair_type="doubles"):
@@ -171,39 +270,11 @@ def single_organ_process(repair_type="doubles"):
         print(f"Input path '{input_file_path}' does not exist.")
         return
 
-    #remove default objects and create new camera
-    clean_scene()
-    camera_data = bpy.data.cameras.new(name='Camera')
-    camera_object = bpy.data.objects.new('Camera', camera_data)
-    bpy.context.scene.collection.objects.link(camera_object)
-    bpy.context.scene.camera = camera_object
-
-    #path to the source file
-    source_path = input_file_path
-    split_path = os.path.splitext(source_path)
-    
-    #extension for the source file
-    extension = split_path[1]
-    
-    #store the filename without the extension
-    filestem = os.path.split(split_path[0])[1]
-    
-    #store the complete filename
-    filename = filestem + extension
-    
-    #output directory for output files (testing only)
-
-    # output_dir = output_root
-    # no need to specify output directory, which is given by the command arguments. 
-    output_dir = ""
-    output_root = ""
-
     logging.info('processing: ' + input_file_path)
 
-    file_locations = FileLocations(filename, filestem, extension, source_path, output_dir, output_root, hdr)
-
     #process the files, levels and max_tris are dictionaries, (key, value) -> (lod, output_filename) or (max_triangle, output_filename)
-    mesh_process(file_locations, repair_type, levels, max_tris)
+    process_file(input_file_path, repair_type, levels, max_tris, hdr, myArg.use_bmesh, myArg.fast_import,
+                 myArg.fast_export, myArg.lean)
  
 
 def all_organ_process(repair_type):
@@ -245,40 +316,14 @@ def all_organ_process(repair_type):
             continue
         if os.path.exists(os.path.join(output_model_dir, file)):
             continue
-        #remove default objects and create new camera
-        clean_scene()
-        camera_data = bpy.data.cameras.new(name='Camera')
-        camera_object = bpy.data.objects.new('Camera', camera_data)
-        bpy.context.scene.collection.objects.link(camera_object)
-        bpy.context.scene.camera = camera_object
-
         #path to the source file
         source_path = os.path.join(input_model_dir, file)
-        split_path = os.path.splitext(source_path)
-        
-        #extension for the source file
-        extension = split_path[1]
-        
-        #store the filename without the extension
-        filestem = os.path.split(split_path[0])[1]
-        
-        #store the complete filename
-        filename = filestem + extension
-        
-        #output directory for output files (testing only)
-
-        # output_dir = output_root
-        # no need to specify output directory, which is given by the command arguments. 
-        output_dir = ""
-        output_root = ""
 
-        logging.info('processing: ' + filename)
-
-        file_locations = FileLocations(filename, filestem, extension, source_path, output_dir, output_root, hdr)
+        logging.info('processing: ' + file)
 
         # No LOD will be given in this case. Add LOD 100 and output filename. 
         # process the files, levels and max_tris are dictionaries, (key, value) -> (lod, output_filename) or (max_triangle, output_filename)
         
-        levels[100] = os.path.join(output_model_dir, filename) 
-        mesh_process(file_locations, repair_type, levels, max_tris)
-        
+        levels[100] = os.path.join(output_model_dir, file) 
+        process_file(source_path, repair_type, levels, max_tris, hdr, myArg.use_bmesh, myArg.fast_import,
+                 myArg.fast_export, myArg.lean)
@@ -1,10 +1,16 @@
 import argparse
 import json
 import os
+import queue
+import shutil
 import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 
-import requests
-from glb_parser import glb_parser_all
+from build_cache import BuildCache
+from glb_downloader import download_files
+from glb_parser import glb_parser_all, list_organs, parse_task
 
 
 # Naive Hashing for url
@@ -13,7 +19,7 @@ def convert_url_to_file(glb_url):
     return next((parts[i + 1] for i, part in enumerate(parts[:-1]) if part == 'ref-organ'), None)
 
 # Get the latest version models
-def download_model(glb_urls, output_folder):
+def download_model(glb_urls, output_folder, jobs=8, callback=None, revalidate=True):
     """A function to download GLB URLs
     """
 
@@ -23,26 +29,195 @@ def download_model(glb_urls, output_folder):
     os.makedirs(output_folder, exist_ok=True)
 
     # Get download URLs
+    tasks = []
     for glb_url in glb_urls:
         glb_file = convert_url_to_file(glb_url)
         if glb_file == None:
             print(glb_url, "looks wrong. skipping.")
             continue
 
-        file_path = os.path.join(output_folder, glb_file + ".glb")
-        
-        # Already downloaded, skip it. 
-        if os.path.exists(file_path):
+        tasks.append((glb_url, os.path.join(output_folder, glb_file + ".glb")))
+
+    return download_files(tasks, jobs, revalidate=revalidate, callback=callback)
+
+
+def cache_params(in_process=False, clean=False):
+    """Parameters of the BuildCache keys"""
+    return {'in_process': in_process, 'clean': clean}
+
+
+def process_organs_cached(input_dir, temp_dir, output_dir, cache_dir, jobs=1, split_mb=None, binary=False,
+                          in_process=False, clean=False):
+    """
+    Incremental version of glb_parser_all + mesh_hole_filling.
+
+    Organs whose GLB, tools and parameters are unchanged are restored from the
+    cache in cache_dir; the others are parsed, repaired and then stored in the
+    cache one organ at a time, so an interrupted run resumes where it stopped.
+    """
+    # the in-process repair runs the hra_mesh extension instead of mesh_hole_filling
+    cache = BuildCache(cache_dir, cache_params(in_process, clean), modules=('hra_mesh',) if in_process else ())
+
+    keys = {}
+    stale = []
+    for organ in list_organs(input_dir):
+        keys[organ] = cache.key(os.path.join(input_dir, organ + '.glb'))
+        organ_output_dir = os.path.join(output_dir, organ)
+        shutil.rmtree(organ_output_dir, ignore_errors=True)
+        if not cache.restore(keys[organ], organ_output_dir):
+            stale.append(organ)
+
+    print("{} organs restored from cache, {} to rebuild".format(len(keys) - len(stale), len(stale)))
+    if not stale:
+        return
+
+    if in_process:
+        # parse and repair straight into the output directory
+        failures = glb_parser_all(input_dir, output_dir, jobs, split_mb, organs=stale, repair=True, clean=clean)
+        for organ in stale:
+            organ_output_dir = os.path.join(output_dir, organ)
+            if organ not in failures and os.path.isdir(organ_output_dir):
+                cache.store(keys[organ], organ, organ_output_dir)
+        return
+
+    # drop leftovers of an interrupted run, so removed meshes do not come back
+    for organ in stale:
+        shutil.rmtree(os.path.join(temp_dir, organ), ignore_errors=True)
+    failures = glb_parser_all(input_dir, temp_dir, jobs, split_mb, organs=stale, binary=binary, clean=clean)
+
+    for organ in stale:
+        if organ in failures:
             continue
-        
-        if glb_url:
-            glb_response = requests.get(glb_url)
-            
-            # Download model
-            if glb_response.status_code == 200:
-                with open(file_path, "wb") as file:
-                    file.write(glb_response.content)
-                    print(f"Downloaded {glb_file}")
+        organ_output_dir = os.path.join(output_dir, organ)
+        result = subprocess.run(['mesh_hole_filling', '-j', str(jobs), temp_dir, output_dir, organ])
+        if result.returncode == 0 and os.path.isdir(organ_output_dir):
+            cache.store(keys[organ], organ, organ_output_dir)
+
+
+def process_organs_pipelined(glb_urls, downloaded_dir, input_dir, temp_dir, output_dir, jobs=1, download_jobs=8,
+                             queue_size=4, binary=False, cache_dir=None, clean=False, revalidate=True):
+    """
+    Streaming version of download_model + glb_parser_all + mesh_hole_filling.
+
+    An organ is parsed as soon as its download finishes and repaired as soon as it
+    is parsed, so downloads, the parser processes and mesh_hole_filling run at the
+    same time. The stages are connected by queues of queue_size organs; a full
+    queue blocks the stage feeding it. Organs of input_dir that are not part of the
+    downloads (e.g. when input_dir holds the Blender stage 1 output) are queued once
+    the downloads are done. With cache_dir, organs are restored from and stored in
+    the same cache as process_organs_cached. Returns a dict organ -> error.
+    """
+    cache = BuildCache(cache_dir, cache_params(clean=clean)) if cache_dir else None
+    parse_queue = queue.Queue(queue_size)
+    repair_queue = queue.Queue(queue_size)
+    failures = {}
+    queued = set()
+    lock = threading.Lock()
+    os.makedirs(input_dir, exist_ok=True)
+    real_input_dir = os.path.realpath(input_dir)
+
+    def enqueue(organ):
+        with lock:
+            if organ in queued:
+                return
+            queued.add(organ)
+        parse_queue.put(organ)
+
+    def downloaded(url, file_path):
+        if os.path.dirname(os.path.realpath(file_path)) == real_input_dir:
+            enqueue(os.path.basename(file_path)[:-4])
+
+    def download_stage():
+        try:
+            download_model(glb_urls, downloaded_dir, download_jobs, callback=downloaded, revalidate=revalidate)
+        except Exception as e:
+            print("downloads stopped: {!r}".format(e))
+        try:
+            for organ in list_organs(input_dir):
+                enqueue(organ)
+        finally:
+            parse_queue.put(None)
+
+    def fail(organ, error):
+        with lock:
+            failures[organ] = error
+        print("failed {}:\n{}".format(organ, error))
+
+    def parse_organ(executor, organ):
+        key = None
+        if cache:
+            key = cache.key(os.path.join(input_dir, organ + '.glb'))
+            organ_output_dir = os.path.join(output_dir, organ)
+            shutil.rmtree(organ_output_dir, ignore_errors=True)
+            if cache.restore(key, organ_output_dir):
+                print("restored {} from cache".format(organ))
+                return
+
+        shutil.rmtree(os.path.join(temp_dir, organ), ignore_errors=True)
+        try:
+            error = executor.submit(parse_task, input_dir, organ, temp_dir, None, binary, False, clean).result()
+        except Exception as e:
+            # the worker process itself died
+            error = repr(e)
+        if error is not None:
+            fail(organ, error)
+            return
+        print("parsed {}".format(organ))
+        repair_queue.put((organ, key))
+
+    def repair_organ(organ, key):
+        organ_output_dir = os.path.join(output_dir, organ)
+        try:
+            returncode = subprocess.run(['mesh_hole_filling', '-j', str(jobs), temp_dir, output_dir, organ]).returncode
+        except OSError as e:
+            returncode = e
+        if returncode != 0 or not os.path.isdir(organ_output_dir):
+            fail(organ, "mesh_hole_filling failed: {}".format(returncode))
+            return
+        print("repaired {}".format(organ))
+        if cache:
+            cache.store(key, organ, organ_output_dir)
+
+    # every organ is handled in a try, a stage that stopped would leave the one feeding it blocked on a full queue
+    def parse_stage(executor):
+        while True:
+            organ = parse_queue.get()
+            if organ is None:
+                # let the other parse threads stop too
+                parse_queue.put(None)
+                return
+            try:
+                parse_organ(executor, organ)
+            except Exception as e:
+                fail(organ, repr(e))
+
+    def repair_stage():
+        while True:
+            item = repair_queue.get()
+            if item is None:
+                return
+            try:
+                repair_organ(*item)
+            except Exception as e:
+                fail(item[0], repr(e))
+
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        threads = [threading.Thread(target=download_stage), threading.Thread(target=repair_stage)]
+        parse_threads = [threading.Thread(target=parse_stage, args=(executor,)) for _ in range(jobs)]
+        for thread in threads + parse_threads:
+            thread.start()
+        for thread in parse_threads:
+            thread.join()
+        repair_queue.put(None)
+        for thread in threads:
+            thread.join()
+
+    print("pipeline processed {} of {} organs in {:.1f} s".format(
+        len(queued) - len(failures), len(queued), time.time() - start))
+    for organ in sorted(failures):
+        print("failed: {}: {}".format(organ, failures[organ].strip().split('\n')[-1]))
+    return failures
 
 
 if __name__ == "__main__":
@@ -58,17 +233,73 @@ if __name__ == "__main__":
     parser.add_argument("--output_off_model_dir", type=str,
                         help="Directory to the preprocessed OFF models", default="manifold_cgal/")
     parser.add_argument("--temp_plain_model_dir", type=str, help="Directory to the temp plain model directory", default="temp_plain_model_off/")
+    parser.add_argument("--download_jobs", type=int,
+                        help="Number of concurrent GLB downloads", default=8)
+    parser.add_argument("--jobs", type=int,
+                        help="Number of processes used to parse the GLB files and of mesh_hole_filling threads", default=1)
+    parser.add_argument("--no_revalidate", action="store_true",
+                        help="Skip GLB files that are already downloaded instead of checking them for changes")
+    parser.add_argument("--split_mb", type=float,
+                        help="Split organs larger than this many MB into one parsing task per mesh", default=None)
+    parser.add_argument("--cache_dir", type=str,
+                        help="Directory of the incremental build cache; only changed organs are rebuilt", default=None)
+    parser.add_argument("--binary_intermediate", action="store_true",
+                        help="Hand meshes to mesh_hole_filling as binary .boff files instead of text OFF")
+    parser.add_argument("--in_process", action="store_true",
+                        help="Repair the meshes with the hra_mesh Python module instead of running mesh_hole_filling")
+    parser.add_argument("--clean", action="store_true",
+                        help="Weld duplicate vertices, drop degenerate / duplicate faces and loose vertices and fix "
+                             "the winding with NumPy before the OFF output (the Blender stage's clean-up, without Blender)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Parse and repair each organ as soon as it is downloaded instead of stage by stage")
+    parser.add_argument("--queue_size", type=int,
+                        help="With --pipeline, number of organs waiting between two stages", default=4)
+    parser.add_argument("--index_dir", type=str,
+                        help="Directory of the mesh index files (mesh_index) used by mesh_query to skip parsing OFF files",
+                        default=None)
+    parser.add_argument("--lod_dir", type=str,
+                        help="Directory of the simplified meshes (mesh_lod), written to lod_dir/<lod>/<organ>/<mesh>.off",
+                        default=None)
+    parser.add_argument("--lods", type=int, nargs="+",
+                        help="With --lod_dir, levels of detail to generate, as percentages of the faces", default=[50, 20])
     args, unknown = parser.parse_known_args()
+    if args.pipeline and args.in_process:
+        parser.error("--pipeline repairs with mesh_hole_filling and cannot be combined with --in_process")
+    if args.pipeline and args.split_mb is not None:
+        parser.error("--pipeline parses every organ as one task and cannot be combined with --split_mb")
 
-    # Download undownloaded models 
     glb_urls = args.urls
     downloaded_dir = args.downloaded_dir
-    download_model(glb_urls, downloaded_dir)
-
     preproceesed_models_stage_1 = args.preproceesed_models_stage_1
     output_off_model_dir = args.output_off_model_dir
     temp_plain_model_dir = args.temp_plain_model_dir
 
-    glb_parser_all(preproceesed_models_stage_1, temp_plain_model_dir)
+    if not args.pipeline:
+        # Download undownloaded models 
+        download_model(glb_urls, downloaded_dir, args.download_jobs, revalidate=not args.no_revalidate)
+
+    if args.pipeline:
+        process_organs_pipelined(glb_urls, downloaded_dir, preproceesed_models_stage_1, temp_plain_model_dir,
+                                 output_off_model_dir, args.jobs, args.download_jobs, args.queue_size,
+                                 args.binary_intermediate, args.cache_dir, args.clean, not args.no_revalidate)
+    elif args.cache_dir:
+        process_organs_cached(preproceesed_models_stage_1, temp_plain_model_dir, output_off_model_dir,
+                              args.cache_dir, args.jobs, args.split_mb, args.binary_intermediate, args.in_process,
+                              args.clean)
+    elif args.in_process:
+        glb_parser_all(preproceesed_models_stage_1, output_off_model_dir, args.jobs, args.split_mb, repair=True,
+                       clean=args.clean)
+    else:
+        glb_parser_all(preproceesed_models_stage_1, temp_plain_model_dir, args.jobs, args.split_mb,
+                       binary=args.binary_intermediate, clean=args.clean)
+
+        subprocess.run(['mesh_hole_filling', '-j', str(args.jobs), temp_plain_model_dir, output_off_model_dir])
+
+    if args.index_dir:
+        # up-to-date index files are kept, only changed meshes are re-indexed
+        subprocess.run(['mesh_index', '-j', str(args.jobs), output_off_model_dir, args.index_dir])
 
-    subprocess.run(['mesh_hole_filling', temp_plain_model_dir, output_off_model_dir])
+    if args.lod_dir:
+        # edge-collapse simplification of the repaired meshes, all levels of a mesh in one pass
+        lods = [arg for lod in args.lods for arg in ('-lod', str(lod))]
+        subprocess.run(['mesh_lod', '-j', str(args.jobs)] + lods + [output_off_model_dir, args.lod_dir])
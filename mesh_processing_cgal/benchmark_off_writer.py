@@ -0,0 +1,59 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from glb_parser import save_single_mesh
+
+
+def save_single_mesh_per_row(points, triangles, mesh_name, output_dir):
+    """The original row-by-row OFF writer, kept here as the baseline."""
+
+    output_path = os.path.join(output_dir, mesh_name + '.off')
+
+    with open(output_path, 'w') as f:
+        f.write("OFF\n")
+        f.write("{} {} 0\n".format(len(points), len(triangles)))
+
+        for point in points:
+            f.write("{} {} {}\n".format(point[0], point[1], point[2]))
+
+        for triangle in triangles:
+            f.write("3 {} {} {}\n".format(triangle[0], triangle[1], triangle[2]))
+
+
+def random_mesh(n_points, n_triangles, seed=0):
+    """A synthetic mesh with the dtypes glb_plain_parser hands to save_single_mesh."""
+    rng = np.random.default_rng(seed)
+    points = (rng.standard_normal((n_points, 3)) * 0.05).astype('float32')
+    triangles = rng.integers(0, n_points, (n_triangles, 3)).astype('uint32')
+    return points, triangles
+
+
+def time_writer(writer, points, triangles, output_dir, name):
+    start = time.time()
+    writer(points, triangles, name, output_dir)
+    return time.time() - start, os.path.join(output_dir, name + '.off')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the OFF writer of glb_parser")
+    parser.add_argument("--points", type=int, help="Number of vertices", default=1000000)
+    parser.add_argument("--triangles", type=int, help="Number of triangles", default=2000000)
+    args = parser.parse_args()
+
+    points, triangles = random_mesh(args.points, args.triangles)
+    print("mesh: {} points, {} triangles".format(len(points), len(triangles)))
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        old_time, old_path = time_writer(save_single_mesh_per_row, points, triangles, output_dir, 'per_row')
+        new_time, new_path = time_writer(save_single_mesh, points, triangles, output_dir, 'bulk')
+
+        with open(old_path, 'rb') as f_old, open(new_path, 'rb') as f_new:
+            identical = f_old.read() == f_new.read()
+
+    print("per-row writer: {:.2f} s".format(old_time))
+    print("bulk writer:    {:.2f} s".format(new_time))
+    print("speedup:        {:.1f}x".format(old_time / new_time))
+    print("byte-identical: {}".format(identical))
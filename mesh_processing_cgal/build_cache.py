@@ -0,0 +1,117 @@
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+
+
+# Bump to invalidate every cached output, e.g. when the OFF layout changes.
+TOOL_VERSION = '1.0.0'
+
+# Sources whose changes must invalidate the cache, next to this file.
+TOOL_SOURCES = ['glb_parser.py', 'glb_accessor.py', 'glb_reader.py', 'numpy_repair.py']
+
+
+def file_hash(path, block_size=1 << 20):
+    """sha256 of a file, read in blocks."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def module_path(name):
+    """File of an importable module (e.g. the hra_mesh extension), found without importing it."""
+    spec = importlib.util.find_spec(name)
+    return spec.origin if spec and spec.origin else name
+
+
+def tool_fingerprint(executables=('mesh_hole_filling',), modules=()):
+    """Hash of TOOL_VERSION, the Python parser sources, the CGAL executables on the PATH and the given modules."""
+    h = hashlib.sha256(TOOL_VERSION.encode())
+    here = os.path.dirname(os.path.abspath(__file__))
+    paths = [os.path.join(here, source) for source in TOOL_SOURCES]
+    paths += [shutil.which(executable) or executable for executable in executables]
+    paths += [module_path(module) for module in modules]
+    for path in paths:
+        h.update(os.path.basename(path).encode())
+        h.update(file_hash(path).encode() if os.path.exists(path) else b'missing')
+    return h.hexdigest()
+
+
+class BuildCache:
+    """
+    Persistent cache of the CGAL stage, keyed on content.
+
+    The manifest maps a key (hash of the input GLB, the tool fingerprint and the
+    parameters) to the OFF files produced for it, stored under objects/<key>/.
+    The manifest is rewritten atomically after every stored organ, so it doubles
+    as a journal: a crashed run restores what was finished and rebuilds the rest.
+    An organ has one entry: storing it again drops the objects of its previous key,
+    and objects no entry refers to (e.g. left by a crashed run) are removed on load.
+    """
+
+    def __init__(self, cache_dir, params=None, modules=()):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.manifest_path = os.path.join(cache_dir, 'manifest.json')
+        self.fingerprint = tool_fingerprint(modules=modules)
+        self.params = json.dumps(params or {}, sort_keys=True)
+
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.entries = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.entries = json.load(f).get('entries', {})
+        self.prune()
+
+    def key(self, input_path):
+        h = hashlib.sha256()
+        for part in (file_hash(input_path), self.fingerprint, self.params):
+            h.update(part.encode())
+        return h.hexdigest()
+
+    def restore(self, key, output_dir):
+        """Copy the cached files of key into output_dir; False if key is not (completely) cached."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        object_dir = os.path.join(self.objects_dir, key)
+        if not all(os.path.exists(os.path.join(object_dir, name)) for name in entry['files']):
+            return False
+
+        os.makedirs(output_dir, exist_ok=True)
+        for name in entry['files']:
+            shutil.copy2(os.path.join(object_dir, name), os.path.join(output_dir, name))
+        return True
+
+    def store(self, key, organ, output_dir):
+        """Copy every file of output_dir into the cache under key and journal it in the manifest."""
+        object_dir = os.path.join(self.objects_dir, key)
+        temp_dir = object_dir + '.tmp'
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        shutil.copytree(output_dir, temp_dir)
+        shutil.rmtree(object_dir, ignore_errors=True)
+        os.replace(temp_dir, object_dir)
+
+        replaced = [old for old, entry in self.entries.items() if entry['organ'] == organ and old != key]
+        for old in replaced:
+            del self.entries[old]
+        self.entries[key] = {'organ': organ, 'files': sorted(os.listdir(object_dir))}
+        self.save()
+        # only once the manifest no longer refers to them
+        for old in replaced:
+            shutil.rmtree(os.path.join(self.objects_dir, old), ignore_errors=True)
+
+    def prune(self):
+        """Remove the object directories no manifest entry refers to."""
+        for name in os.listdir(self.objects_dir):
+            if name not in self.entries:
+                shutil.rmtree(os.path.join(self.objects_dir, name), ignore_errors=True)
+
+    def save(self):
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'version': TOOL_VERSION, 'entries': self.entries}, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.manifest_path)
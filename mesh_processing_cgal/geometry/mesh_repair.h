@@ -0,0 +1,30 @@
+#ifndef MESH_REPAIR_H_
+#define MESH_REPAIR_H_
+
+#include <CGAL/Polygon_mesh_processing/orient_polygon_soup.h>
+#include <CGAL/Polygon_mesh_processing/polygon_soup_to_polygon_mesh.h>
+#include <vector>
+
+// Repair step shared by mesh_hole_filling and the hra_mesh Python module.
+// Soups that already form a valid polygon mesh are converted directly; only the
+// others (non-manifold inputs) go through orient_polygon_soup first.
+// Returns true if the soup had to be oriented.
+template <class PointT, class MeshT>
+bool polygon_soup_to_repaired_mesh(std::vector<PointT> &points,
+                                   std::vector<std::vector<std::size_t> > &polygons, MeshT &mesh)
+{
+    namespace PMP = CGAL::Polygon_mesh_processing;
+
+    if (PMP::is_polygon_soup_a_polygon_mesh(polygons))
+    {
+        PMP::polygon_soup_to_polygon_mesh(points, polygons, mesh);
+        return false;
+    }
+
+    //fix non-manifold meshes
+    PMP::orient_polygon_soup(points, polygons);
+    PMP::polygon_soup_to_polygon_mesh(points, polygons, mesh);
+    return true;
+}
+
+#endif
@@ -1,5 +1,52 @@
 #include "mymesh.h"
 
+#include <algorithm>
+#include <cstring>
+#include <thread>
+
+#include <boost/interprocess/file_mapping.hpp>
+#include <boost/interprocess/mapped_region.hpp>
+
+// Mesh index file: a cache of the triangulated mesh as flat arrays that can be memory-mapped,
+// so loading skips parsing and triangulating the OFF file. It is not a persisted AABB tree
+// (CGAL's AABB_tree cannot be serialized): the tree is still built from the loaded mesh.
+// Native byte order.
+//   Index_header, float64 x y z per vertex, uint32 a b c per face
+namespace {
+    const char index_magic[8] = {'H', 'R', 'A', 'I', 'D', 'X', '0', '3'};
+
+    struct Index_header
+    {
+        char magic[8];
+        std::uint64_t content_hash;
+        std::uint64_t num_vertices;
+        std::uint64_t num_faces;
+    };
+}
+
+std::uint64_t mesh_file_hash(const std::string &file_path)
+{
+    std::ifstream input(file_path, std::ios::binary);
+    // whole 64-bit words per step, much faster than a byte-wise hash on large files
+    std::vector<std::uint64_t> block(1 << 17);
+    std::uint64_t hash = 14695981039346656037ULL;
+    std::uint64_t length = 0;
+    while (input.read(reinterpret_cast<char*>(block.data()), block.size() * sizeof(std::uint64_t)) || input.gcount() > 0)
+    {
+        std::size_t bytes = input.gcount();
+        // zero the bytes past the end of a last, partial word
+        if (bytes % sizeof(std::uint64_t))
+            std::memset(reinterpret_cast<char*>(block.data()) + bytes, 0, sizeof(std::uint64_t) - bytes % sizeof(std::uint64_t));
+        for (std::size_t i = 0; i < (bytes + sizeof(std::uint64_t) - 1) / sizeof(std::uint64_t); i++)
+        {
+            hash = (hash ^ block[i]) * 0x9E3779B97F4A7C15ULL;
+            hash ^= hash >> 32;
+        }
+        length += bytes;
+    }
+    return (hash ^ length) * 0x9E3779B97F4A7C15ULL;
+}
+
 bool Mymesh::load_from_off(const std::string &file_path) {
     
     std::ifstream input(file_path);
@@ -15,13 +62,124 @@ bool Mymesh::load_from_off(const std::string &file_path) {
 
     this->label = AS_name;
     this->is_surface = true;
-
-    if (CGAL::is_closed(this->mesh)) this->is_closed = true;
+    this->is_closed = CGAL::is_closed(this->mesh);
     
     return true;
 
 }
 
+bool Mymesh::load_with_index(const std::string &off_path, const std::string &index_path)
+{
+    std::uint64_t content_hash = mesh_file_hash(off_path);
+    if (fs::exists(index_path) && load_from_index(index_path, content_hash))
+    {
+        this->label = fs::path(off_path).stem().string();
+        return true;
+    }
+
+    if (!load_from_off(off_path)) return false;
+    triangulate_mesh();
+    write_index(index_path, content_hash);
+    return true;
+}
+
+bool Mymesh::load_from_index(const std::string &index_path, std::uint64_t content_hash)
+{
+    namespace bip = boost::interprocess;
+
+    try
+    {
+        bip::file_mapping file(index_path.c_str(), bip::read_only);
+        bip::mapped_region region(file, bip::read_only);
+        const char *data = static_cast<const char*>(region.get_address());
+
+        Index_header header;
+        if (region.get_size() < sizeof(header)) return false;
+        std::memcpy(&header, data, sizeof(header));
+        if (std::memcmp(header.magic, index_magic, sizeof(index_magic)) != 0) return false;
+        if (header.content_hash != content_hash) return false;
+        if (region.get_size() != sizeof(header) + header.num_vertices * 3 * sizeof(double)
+                                                + header.num_faces * 3 * sizeof(std::uint32_t)) return false;
+
+        const double *coords = reinterpret_cast<const double*>(data + sizeof(header));
+        const std::uint32_t *indices = reinterpret_cast<const std::uint32_t*>(coords + header.num_vertices * 3);
+
+        Surface_mesh loaded;
+        loaded.reserve(header.num_vertices, header.num_faces * 3 / 2, header.num_faces);
+        for (std::uint64_t i = 0; i < header.num_vertices; i++)
+            loaded.add_vertex(Point(coords[3 * i], coords[3 * i + 1], coords[3 * i + 2]));
+        for (std::uint64_t i = 0; i < header.num_faces; i++)
+        {
+            if (std::max({indices[3 * i], indices[3 * i + 1], indices[3 * i + 2]}) >= header.num_vertices) return false;
+            face_descriptor f = loaded.add_face(vertex_descriptor(indices[3 * i]),
+                                                vertex_descriptor(indices[3 * i + 1]),
+                                                vertex_descriptor(indices[3 * i + 2]));
+            if (f == Surface_mesh::null_face()) return false;
+        }
+        this->mesh = std::move(loaded);
+    }
+    catch (const bip::interprocess_exception &)
+    {
+        return false;
+    }
+
+    this->aabbTree.reset();
+    this->is_surface = true;
+    this->is_closed = CGAL::is_closed(this->mesh);
+    return true;
+}
+
+bool Mymesh::write_index(const std::string &index_path, std::uint64_t content_hash)
+{
+    Index_header header;
+    std::memcpy(header.magic, index_magic, sizeof(index_magic));
+    header.content_hash = content_hash;
+    header.num_vertices = mesh.number_of_vertices();
+    header.num_faces = mesh.number_of_faces();
+
+    // compact vertex indices, in case the mesh has removed elements
+    std::vector<std::uint32_t> index(mesh.num_vertices());
+    std::vector<double> coords;
+    coords.reserve(3 * header.num_vertices);
+    for (vertex_descriptor v : mesh.vertices())
+    {
+        index[v] = coords.size() / 3;
+        const Point &p = mesh.point(v);
+        coords.insert(coords.end(), {p.x(), p.y(), p.z()});
+    }
+
+    std::vector<std::uint32_t> faces;
+    faces.reserve(3 * header.num_faces);
+    for (face_descriptor f : mesh.faces())
+    {
+        std::size_t n = 0;
+        for (vertex_descriptor v : CGAL::vertices_around_face(mesh.halfedge(f), mesh))
+        {
+            faces.push_back(index[v]);
+            n++;
+        }
+        if (n != 3)
+        {
+            std::cerr << "Error: non-triangular face, cannot write index " << index_path << std::endl;
+            return false;
+        }
+    }
+
+    // write to a temporary file first, so readers never map a half-written index
+    fs::path path(index_path);
+    if (path.has_parent_path()) fs::create_directories(path.parent_path());
+    std::string temp_path = index_path + ".tmp";
+    {
+        std::ofstream output(temp_path, std::ios::binary);
+        output.write(reinterpret_cast<const char*>(&header), sizeof(header));
+        output.write(reinterpret_cast<const char*>(coords.data()), coords.size() * sizeof(double));
+        output.write(reinterpret_cast<const char*>(faces.data()), faces.size() * sizeof(std::uint32_t));
+        if (!output) return false;
+    }
+    fs::rename(temp_path, index_path);
+    return true;
+}
+
 bool Mymesh::triangulate_mesh() {
 
     PMP::triangulate_faces(this->mesh);
@@ -61,6 +219,32 @@ double Mymesh::percentage_points_inside(std::vector<Point> &query)
 
 }
 
+void Mymesh::points_inside(const std::vector<Point> &query, std::vector<unsigned char> &inside, unsigned int num_threads)
+{
+    inside.assign(query.size(), 0);
+    if (query.empty()) return;
+
+    // the first query completes any lazy initialization of the tree before it is shared
+    Point_inside first_tester(*aabbTree);
+    inside[0] = first_tester(query[0]) == CGAL::ON_BOUNDED_SIDE;
+
+    // each thread takes a contiguous block of points and uses its own tester on the shared tree
+    num_threads = std::max(1u, std::min<unsigned int>(num_threads, query.size()));
+    std::size_t block = (query.size() + num_threads - 1) / num_threads;
+    auto worker = [&](std::size_t begin, std::size_t end)
+    {
+        Point_inside inside_tester(*aabbTree);
+        for (std::size_t i = std::max<std::size_t>(begin, 1); i < end; i++)
+            inside[i] = inside_tester(query[i]) == CGAL::ON_BOUNDED_SIDE;
+    };
+
+    std::vector<std::thread> threads;
+    for (unsigned int t = 1; t < num_threads; t++)
+        threads.emplace_back(worker, t * block, std::min(query.size(), (t + 1) * block));
+    worker(0, std::min(query.size(), block));
+    for (std::thread &thread : threads) thread.join();
+}
+
 void Mymesh::create_aabb_tree() {
 
         // std::unique_ptr<Tree> tree = std::make_unique<Tree> (faces(mesh).first, faces(mesh).second, mesh);
@@ -10,6 +10,7 @@
 #include<fstream>
 #include<iostream>
 #include<vector>
+#include<cstdint>
 
 typedef CGAL::Simple_cartesian<double> Kernel;
 typedef Kernel::Point_3 Point;
@@ -32,6 +33,9 @@ using std::vector;
 #include<boost/filesystem.hpp>
 namespace fs = boost::filesystem;
 
+// 64-bit hash of a file's content, used to validate mesh index files
+std::uint64_t mesh_file_hash(const std::string &file_path);
+
 class Mymesh{
 
     public:
@@ -42,9 +46,16 @@ class Mymesh{
         ~Mymesh(){};
 
         bool load_from_off(const std::string &file_path);
+        // Load the triangulated mesh from its index file if the index matches the OFF content,
+        // otherwise load and triangulate the OFF file and (re)write the index.
+        bool load_with_index(const std::string &off_path, const std::string &index_path);
+        bool load_from_index(const std::string &index_path, std::uint64_t content_hash);
+        bool write_index(const std::string &index_path, std::uint64_t content_hash);
         bool triangulate_mesh();
         bool point_inside(Point &query);
         double percentage_points_inside(std::vector<Point> &query);
+        // inside flag (1/0) of every query point, evaluated by num_threads threads sharing the AABB tree
+        void points_inside(const std::vector<Point> &query, std::vector<unsigned char> &inside, unsigned int num_threads = 1);
 
         void create_aabb_tree();
         Surface_mesh& get_raw_mesh();
@@ -56,8 +67,8 @@ class Mymesh{
     public:
         std::shared_ptr<Tree> aabbTree;
         std::string label;
-        bool is_closed;
-        bool is_surface;
+        bool is_closed = false;
+        bool is_surface = false;
 };
 
 #endif
\ No newline at end of file
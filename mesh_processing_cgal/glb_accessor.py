@@ -0,0 +1,134 @@
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+
+data_type_dict = {5120: 'int8', 5121: 'uint8', 5122: 'int16', 5123: 'uint16', 5125: 'uint32', 5126: 'float32'}
+number_of_components = {'SCALAR': 1, 'VEC2': 2, 'VEC3': 3, 'VEC4': 4, 'MAT2': 4, 'MAT3': 9, 'MAT4': 16}
+
+# primitive modes, see https://registry.khronos.org/glTF/specs/2.0/glTF-2.0.html#_mesh_primitive_mode
+TRIANGLES = 4
+TRIANGLE_STRIP = 5
+TRIANGLE_FAN = 6
+
+
+def buffer_view_array(gltf, buffer, buffer_view_index, byte_offset, dtype, count, components):
+    """
+    Zero-copy (count, components) view of a bufferView in buffer (bytes, memoryview or mmap).
+
+    Interleaved bufferViews (byteStride larger than one element) are mapped with
+    as_strided, so nothing is copied either way. Raises ValueError if the
+    accessor does not fit in its bufferView.
+    """
+    buffer_view = gltf.bufferViews[buffer_view_index]
+    if (buffer_view.buffer or 0) != 0:
+        raise ValueError("only the GLB binary chunk (buffer 0) is supported, got buffer {}".format(buffer_view.buffer))
+
+    dtype = np.dtype(dtype)
+    element_size = dtype.itemsize * components
+    stride = buffer_view.byteStride or element_size
+    if count == 0:
+        return np.empty((0, components), dtype=dtype)
+
+    nbytes = stride * (count - 1) + element_size
+    if byte_offset + nbytes > buffer_view.byteLength:
+        raise ValueError("accessor overruns bufferView {}".format(buffer_view_index))
+
+    # np.frombuffer checks the range against the buffer and does not copy
+    raw = np.frombuffer(buffer, dtype=np.uint8, count=nbytes, offset=(buffer_view.byteOffset or 0) + byte_offset)
+    if stride == element_size:
+        return raw.view(dtype).reshape((count, components))
+
+    first = raw[:element_size].view(dtype)
+    return as_strided(first, shape=(count, components), strides=(stride, dtype.itemsize), writeable=False)
+
+
+def normalize(values):
+    """Convert normalized integer components to float32, as defined by the glTF spec."""
+    info = np.iinfo(values.dtype)
+    values = values.astype('float32') / info.max
+    if info.min < 0:
+        np.maximum(values, -1.0, out=values)
+    return values
+
+
+def accessor_array(gltf, buffer, accessor_index):
+    """
+    (count, components) array of an accessor.
+
+    Plain accessors are returned as read-only views into buffer. Normalized and
+    sparse accessors cannot be expressed as views and are returned as new arrays.
+    """
+    accessor = gltf.accessors[accessor_index]
+    dtype = data_type_dict[accessor.componentType]
+    components = number_of_components[accessor.type]
+
+    if accessor.bufferView is not None:
+        values = buffer_view_array(gltf, buffer, accessor.bufferView, accessor.byteOffset or 0,
+                                   dtype, accessor.count, components)
+    else:
+        values = np.zeros((accessor.count, components), dtype=dtype)
+
+    sparse = accessor.sparse
+    if sparse is not None and sparse.count:
+        indices = buffer_view_array(gltf, buffer, sparse.indices.bufferView, sparse.indices.byteOffset or 0,
+                                    data_type_dict[sparse.indices.componentType], sparse.count, 1).ravel()
+        substitutes = buffer_view_array(gltf, buffer, sparse.values.bufferView, sparse.values.byteOffset or 0,
+                                        dtype, sparse.count, components)
+        values = values.copy()
+        values[indices] = substitutes
+
+    if accessor.normalized and values.dtype.kind in 'iu':
+        values = normalize(values)
+
+    return values
+
+
+def primitive_triangles(gltf, buffer, primitive, number_of_points):
+    """(n, 3) triangle indices of a primitive, or None if it is not made of triangles."""
+    mode = TRIANGLES if primitive.mode is None else primitive.mode
+    if primitive.indices is not None:
+        indices = accessor_array(gltf, buffer, primitive.indices).ravel()
+    else:
+        indices = np.arange(number_of_points, dtype='uint32')
+
+    if mode in (TRIANGLE_STRIP, TRIANGLE_FAN) and len(indices) < 3:
+        return np.empty((0, 3), dtype=indices.dtype)
+    if mode == TRIANGLES:
+        return indices[:len(indices) - len(indices) % 3].reshape((-1, 3))
+    if mode == TRIANGLE_STRIP:
+        # every other triangle of a strip is flipped to keep the winding consistent
+        triangles = np.stack([indices[:-2], indices[1:-1], indices[2:]], axis=1)
+        triangles[1::2, [0, 1]] = triangles[1::2, [1, 0]]
+        return triangles
+    if mode == TRIANGLE_FAN:
+        return np.stack([np.full(len(indices) - 2, indices[0], dtype=indices.dtype), indices[1:-1], indices[2:]], axis=1)
+    return None
+
+
+def mesh_arrays(gltf, buffer, mesh):
+    """
+    Points and triangles of all the triangle primitives of a mesh.
+
+    A mesh with a single primitive is returned as views into buffer; several
+    primitives are merged into one vertex array with re-based indices.
+    """
+    parts = []
+    for primitive in mesh.primitives:
+        if primitive.attributes.POSITION is None:
+            continue
+        points = accessor_array(gltf, buffer, primitive.attributes.POSITION)
+        triangles = primitive_triangles(gltf, buffer, primitive, len(points))
+        if triangles is None:
+            print("skipping primitive with mode {} in mesh {}".format(primitive.mode, mesh.name))
+            continue
+        parts.append((points, triangles))
+
+    if len(parts) == 1:
+        return parts[0]
+    if not parts:
+        return np.empty((0, 3), dtype='float32'), np.empty((0, 3), dtype='uint32')
+
+    offsets = np.cumsum([0] + [len(points) for points, _ in parts[:-1]])
+    points = np.concatenate([points for points, _ in parts])
+    triangles = np.concatenate([triangles.astype('uint32') + np.uint32(offset) for (_, triangles), offset in zip(parts, offsets)])
+    return points, triangles
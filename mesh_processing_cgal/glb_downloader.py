@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# Shared by the download_model functions of both stages
+# (all_organ_preprocessor_cgal.py and mesh_processing_blender/glb_preprocessor_all_organs.py).
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# bytes read per write; an interrupted transfer resumes after the last complete chunk
+CHUNK_SIZE = 1 << 16
+
+
+class DownloadError(Exception):
+    pass
+
+
+class IncompleteDownload(requests.RequestException):
+    pass
+
+
+def make_session(pool_size):
+    """A requests session keeping up to pool_size connections alive per host."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+# Validators (ETag, Last-Modified) of a downloaded file are kept next to it in <file>.meta,
+# those of an unfinished transfer in <file>.part.meta.
+
+def read_meta(path):
+    try:
+        with open(path + '.meta') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_meta(path, meta):
+    with open(path + '.meta.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(path + '.meta.tmp', path + '.meta')
+
+
+def remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def content_range_start(response):
+    """First byte of a 206 answer, from its 'Content-Range: bytes start-end/total' header (None if missing)"""
+    unit, _, byte_range = response.headers.get('Content-Range', '').partition(' ')
+    start = byte_range.split('-')[0]
+    return int(start) if unit == 'bytes' and start.isdigit() else None
+
+
+def fetch(session, url, file_path, timeout, chunk_size=CHUNK_SIZE):
+    """
+    Download url into file_path, returns ('downloaded' | 'resumed' | 'unchanged', bytes received).
+
+    The body is streamed into <file>.part and renamed over file_path once complete,
+    so file_path is never a partial download. An existing file is revalidated with
+    If-None-Match / If-Modified-Since; an existing .part file is resumed with a
+    Range request guarded by If-Range. An existing file without a .meta file (downloaded
+    before they existed) is kept, with the validators of a HEAD request recorded for next time.
+    """
+    part_path = file_path + '.part'
+    # identity encoding, so byte ranges and Content-Length refer to the file itself
+    headers = {'Accept-Encoding': 'identity'}
+
+    if os.path.exists(file_path) and not os.path.exists(file_path + '.meta'):
+        with session.head(url, headers=headers, timeout=timeout, allow_redirects=True) as response:
+            if response.status_code in RETRY_STATUS:
+                raise requests.HTTPError("{} {}".format(response.status_code, response.reason), response=response)
+            if response.status_code == 200:
+                write_meta(file_path, {'url': url, 'etag': response.headers.get('ETag'),
+                                       'last_modified': response.headers.get('Last-Modified')})
+                return 'unchanged', 0
+        # no usable HEAD answer, fetch the file again
+
+    meta = read_meta(file_path) if os.path.exists(file_path) else None
+    if meta and meta.get('url') == url:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    part_meta = read_meta(part_path) if os.path.exists(part_path) else None
+    offset = 0
+    if part_meta and part_meta.get('url') == url and (part_meta.get('etag') or part_meta.get('last_modified')):
+        offset = os.path.getsize(part_path)
+        headers['Range'] = 'bytes={}-'.format(offset)
+        headers['If-Range'] = part_meta.get('etag') or part_meta['last_modified']
+
+    with session.get(url, headers=headers, timeout=timeout, stream=True) as response:
+        if response.status_code == 304:
+            return 'unchanged', 0
+        if response.status_code == 416:
+            # the partial file does not match the remote one, start over
+            remove(part_path)
+            remove(part_path + '.meta')
+            raise IncompleteDownload("416 Range Not Satisfiable")
+        if response.status_code in RETRY_STATUS:
+            raise requests.HTTPError("{} {}".format(response.status_code, response.reason), response=response)
+        if response.status_code not in (200, 206):
+            raise DownloadError("{} {}".format(response.status_code, response.reason))
+
+        if response.status_code == 200:
+            offset = 0
+        elif content_range_start(response) != offset:
+            # a server that ignored the offset would corrupt the file when appended, start over
+            remove(part_path)
+            remove(part_path + '.meta')
+            raise IncompleteDownload("206 answer does not start at byte {}".format(offset))
+        meta = {'url': url, 'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+        write_meta(part_path, meta)
+
+        expected = response.headers.get('Content-Length')
+        received = 0
+        with open(part_path, 'ab' if offset else 'wb') as f:
+            for chunk in response.iter_content(chunk_size):
+                f.write(chunk)
+                received += len(chunk)
+
+    if expected is not None and received != int(expected):
+        raise IncompleteDownload("received {} of {} bytes".format(received, expected))
+
+    os.replace(part_path, file_path)
+    write_meta(file_path, meta)
+    remove(part_path + '.meta')
+    return ('resumed' if offset else 'downloaded'), received
+
+
+def download_files(tasks, jobs=8, per_host=4, retries=3, backoff=0.5, timeout=60, session=None, revalidate=True,
+                   callback=None):
+    """
+    Download (url, file_path) pairs with a pool of jobs threads.
+
+    At most per_host transfers run against the same host at a time. Connection
+    errors, timeouts, truncated bodies and 429/5xx answers are retried up to
+    retries times, waiting backoff * 2**attempt seconds in between, and resume
+    where they stopped; other HTTP errors fail at once. Existing files are
+    revalidated and only fetched again if they changed upstream, or skipped
+    without a request if revalidate is False. callback(url, file_path) is called
+    from the pool threads as soon as a file is ready. Returns a summary dict and prints it.
+    """
+    session = session or make_session(max(jobs, per_host))
+    host_limits = {}
+    for url, _ in tasks:
+        host_limits.setdefault(urlsplit(url).netloc, threading.BoundedSemaphore(per_host))
+
+    summary = {'downloaded': 0, 'resumed': 0, 'unchanged': 0, 'bytes': 0, 'retries': 0, 'failed': {}}
+    lock = threading.Lock()
+
+    def download(url, file_path):
+        if not revalidate and os.path.exists(file_path):
+            with lock:
+                summary['unchanged'] += 1
+            if callback:
+                callback(url, file_path)
+            return
+
+        for attempt in range(retries + 1):
+            try:
+                with host_limits[urlsplit(url).netloc]:
+                    status, size = fetch(session, url, file_path, timeout)
+                with lock:
+                    summary[status] += 1
+                    summary['bytes'] += size
+                if status != 'unchanged':
+                    print("Downloaded", os.path.basename(file_path))
+                if callback:
+                    callback(url, file_path)
+                return
+            except DownloadError as e:
+                error = e
+                break
+            except requests.RequestException as e:
+                error = e
+                if attempt < retries:
+                    with lock:
+                        summary['retries'] += 1
+                    time.sleep(backoff * 2 ** attempt)
+
+        with lock:
+            summary['failed'][url] = str(error)
+        print("Failed to download", url, "-", error)
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for _ in executor.map(lambda task: download(*task), tasks):
+            pass
+    summary['seconds'] = time.time() - start
+
+    print("{} downloaded ({} resumed, {:.1f} MB), {} unchanged, {} failed, {} retries in {:.1f} s".format(
+        summary['downloaded'] + summary['resumed'], summary['resumed'], summary['bytes'] / 1e6,
+        summary['unchanged'], len(summary['failed']), summary['retries'], summary['seconds']))
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download a list of URLs into a directory")
+    parser.add_argument("urls", type=str, help="File with one URL per line")
+    parser.add_argument("output_dir", type=str, help="Folder to save the downloaded files")
+    parser.add_argument("--jobs", type=int, help="Number of concurrent downloads", default=8)
+    parser.add_argument("--per_host", type=int, help="Number of concurrent downloads per host", default=4)
+    parser.add_argument("--retries", type=int, help="Number of retries of a failing download", default=3)
+    parser.add_argument("--no_revalidate", action="store_true",
+                        help="Skip files that are already downloaded instead of checking them for changes")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    urls = [url for url in open(args.urls).read().split('\n') if url.strip()]
+    tasks = [(url, os.path.join(args.output_dir, os.path.basename(urlsplit(url).path))) for url in urls]
+    summary = download_files(tasks, args.jobs, args.per_host, args.retries, revalidate=not args.no_revalidate)
+    exit(1 if summary['failed'] else 0)
@@ -1,70 +1,94 @@
 import argparse
 import numpy as np
 import os
-from pygltflib import GLTF2
+import struct
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glb_reader import GLBReader, glb_json
+from numpy_repair import clean_mesh
 
 
-def glb_plain_parser(input_dir, organ: str, output_dir):
+def glb_plain_parser(input_dir, organ: str, output_dir, mesh_indices=None, binary=False, repair=False, clean=False):
 
     # file = "C:/Users/catherine/Desktop/Research/ccf-releases/v1.1/models/" + organ + '.glb'
     file = os.path.join(input_dir, organ + '.glb')
-    data_type_dict = {5121: 'uint8', 5123: 'uint16', 5125: 'uint32', 5126: 'float32'}
-    number_of_components = {'SCALAR': 1, 'VEC2': 2, 'VEC3': 3, 'VEC4': 4, 'MAT2': 4, 'MAT3': 9, 'MAT4': 16}
-
-    glb = GLTF2.load(file)
-    binary_blob = glb.binary_blob()
     output_organ_dir = os.path.join(output_dir, organ)
 
-    mesh_node_name_mapping = {}
-    for node in glb.nodes:
-        if node.mesh != None:
-            mesh_node_name_mapping[node.mesh] = node.name
-
-           
-
-    mesh_node_name_mapping_2 = {}
-    for i, mesh in enumerate(glb.meshes):
-
-        # mesh_name = mesh.name
-        mesh_name = mesh_node_name_mapping[i]
-        
-        mesh_node_name_mapping_2[i] = mesh_name
-        triangles_accessor = glb.accessors[mesh.primitives[0].indices]
-        triangles_buffer_view = glb.bufferViews[triangles_accessor.bufferView]
-        dtype = data_type_dict[triangles_accessor.componentType]
-
-        triangles = np.frombuffer(
-            binary_blob[triangles_buffer_view.byteOffset + triangles_accessor.byteOffset:
-                        triangles_buffer_view.byteOffset + triangles_buffer_view.byteLength],
-            dtype=dtype,
-            count=triangles_accessor.count,
-        ).reshape((-1, 3))
-
-        points_accessor = glb.accessors[mesh.primitives[0].attributes.POSITION]
-        points_buffer_view = glb.bufferViews[points_accessor.bufferView]
-        dtype = data_type_dict[points_accessor.componentType]
-
-        points = np.frombuffer(
-            binary_blob[points_buffer_view.byteOffset + points_accessor.byteOffset:
-            points_buffer_view.byteOffset + points_buffer_view.byteLength],
-            dtype=dtype,
-            count=points_accessor.count * 3,
-        ).reshape((-1, 3))
-
-        save_single_mesh(points, triangles, mesh_name, output_organ_dir)
-    
-    
-    if mesh_node_name_mapping != mesh_node_name_mapping_2:
+    # the BIN chunk is memory-mapped, meshes are decoded one at a time
+    with GLBReader(file) as reader:
+        glb = reader.gltf
+
+        mesh_node_name_mapping = {}
+        for node in glb.nodes:
+            if node.mesh != None:
+                mesh_node_name_mapping[node.mesh] = node.name
+
+        mesh_node_name_mapping_2 = {}
+        for i, mesh in enumerate(glb.meshes):
+            # only parse the requested meshes when the organ is split into per-mesh tasks
+            if mesh_indices is not None and i not in mesh_indices:
+                continue
+
+            # mesh_name = mesh.name
+            mesh_name = mesh_node_name_mapping[i]
+
+            mesh_node_name_mapping_2[i] = mesh_name
+            # views into the mapped file, covering every primitive of the mesh
+            points, triangles = reader.mesh_arrays(i)
+            if clean:
+                points, triangles, stats = clean_mesh(points, triangles)
+                if any(stats.values()):
+                    changes = ", ".join("{} {}".format(count, change) for change, count in stats.items() if count)
+                    print("   cleaned {}: {}".format(mesh_name, changes))
+            if repair:
+                points, triangles = repair_mesh(points, triangles)
+
+            if binary:
+                save_single_mesh_binary(points, triangles, mesh_name, output_organ_dir)
+            else:
+                save_single_mesh(points, triangles, mesh_name, output_organ_dir)
+
+            # drop the views so the pages of this mesh can be reclaimed before the next one
+            del points, triangles
+            reader.release()
+
+    if mesh_indices is None and mesh_node_name_mapping != mesh_node_name_mapping_2:
         print("***************************************")
         print("node mapping: ", mesh_node_name_mapping)
         print("mesh mapping: ", mesh_node_name_mapping_2)
          
 
+def repair_mesh(points, triangles):
+    """Run the mesh_hole_filling repair in-process with the hra_mesh extension module."""
+    # only needed for --repair, so the parser keeps working without the compiled module
+    import hra_mesh
+
+    points, triangles, _ = hra_mesh.repair(points, triangles)
+    return points, triangles
+
+
+# Number of rows formatted per write when dumping OFF files. Keeps the
+# intermediate string bounded (a few MB) even for meshes with millions of faces.
+OFF_CHUNK_ROWS = 65536
+
+
+def write_off_rows(f, row_format, rows, chunk_rows=OFF_CHUNK_ROWS):
+    """Write a 2D array to f, formatting a whole chunk of rows with one % call.
+
+    row_format is the printf template of a single row, e.g. "%r %r %r\n".
+    NumPy scalars are converted with tolist() first, so floats go through
+    Python's repr, exactly like "{}".format(point[0]) used to.
+    """
+    for start in range(0, len(rows), chunk_rows):
+        chunk = rows[start:start + chunk_rows]
+        f.write((row_format * len(chunk)) % tuple(chunk.ravel().tolist()))
+
+
 def save_single_mesh(points, triangles, mesh_name, output_dir):
 
     # print("mesh_name: ", mesh_name)
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    # several worker processes may write meshes of the same organ
+    os.makedirs(output_dir, exist_ok=True)
 
     output_path = os.path.join(output_dir, mesh_name + '.off')
 
@@ -72,27 +96,142 @@ def save_single_mesh(points, triangles, mesh_name, output_dir):
         f.write("OFF\n")
         f.write("{} {} 0\n".format(len(points), len(triangles)))
 
-        for point in points:
-            f.write("{} {} {}\n".format(point[0], point[1], point[2]))
-
-        for triangle in triangles:
-            f.write("3 {} {} {}\n".format(triangle[0], triangle[1], triangle[2]))
+        write_off_rows(f, "%r %r %r\n", points)
+        write_off_rows(f, "3 %d %d %d\n", triangles)
 
         # print("   {} has {} points, {} triangle faces\n".format(mesh_name, len(points), len(triangles)))
 
 
-def glb_parser_all(input_dir, output_dir):
-    
-    # List all the files in input_dir
-    files = os.listdir(input_dir)
+# Binary hand-off format read by mesh_hole_filling, all little-endian:
+# b'BOFF', uint32 version, uint32 number of points, uint32 number of triangles,
+# float32 x y z per point, uint32 a b c per triangle.
+BINARY_MESH_MAGIC = b'BOFF'
+BINARY_MESH_VERSION = 1
+
+
+def save_single_mesh_binary(points, triangles, mesh_name, output_dir):
+    """
+    Same as save_single_mesh, but writes the raw arrays to <mesh_name>.boff.
+    Points keep their float32 values, so nothing is lost compared to the text OFF.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    output_path = os.path.join(output_dir, mesh_name + '.boff')
+
+    with open(output_path, 'wb') as f:
+        f.write(BINARY_MESH_MAGIC)
+        f.write(struct.pack('<III', BINARY_MESH_VERSION, len(points), len(triangles)))
+
+        for rows, dtype in ((points, '<f4'), (triangles, '<u4')):
+            for start in range(0, len(rows), OFF_CHUNK_ROWS):
+                f.write(np.ascontiguousarray(rows[start:start + OFF_CHUNK_ROWS], dtype=dtype).tobytes())
+
+
+def list_organs(input_dir):
+    """Sorted organ names (file names without .glb) in input_dir."""
+    return sorted(f[:-4] for f in os.listdir(input_dir) if f.endswith('.glb'))
+
+
+def glb_mesh_names(file):
+    """Read only the JSON chunk of a GLB and return the node name of every mesh, by mesh index."""
+    gltf = glb_json(file)
+
+    names = [None] * len(gltf.get('meshes', []))
+    for node in gltf.get('nodes', []):
+        if node.get('mesh') is not None:
+            names[node['mesh']] = node.get('name')
+    return names
+
+
+def make_parse_tasks(input_dir, organs, split_mb=None):
+    """
+    Split the work into (organ, mesh_indices) tasks. Organs are the unit of work;
+    organs larger than split_mb are split into one task per mesh, unless two meshes
+    map to the same output file, in which case the organ stays in one task so the
+    last mesh wins, as in the serial parser.
+    """
+    tasks = []
+    for organ in organs:
+        file = os.path.join(input_dir, organ + '.glb')
+        if split_mb is not None and os.path.getsize(file) > split_mb * 1024 * 1024:
+            try:
+                names = glb_mesh_names(file)
+            except (OSError, ValueError, struct.error):
+                # leave broken files to the worker, which reports the error
+                names = []
+            if len(names) > 1 and len(set(names)) == len(names):
+                tasks.extend((organ, [i]) for i in range(len(names)))
+                continue
+        tasks.append((organ, None))
+    return tasks
+
+
+def parse_task(input_dir, organ, output_dir, mesh_indices, binary=False, repair=False, clean=False):
+    """Worker entry point: parse one task and return the traceback instead of raising."""
+    try:
+        glb_plain_parser(input_dir, organ, output_dir, mesh_indices, binary, repair, clean)
+        return None
+    except Exception:
+        return traceback.format_exc()
+
+
+def glb_parser_all(input_dir, output_dir, jobs=1, split_mb=None, organs=None, binary=False, repair=False,
+                   clean=False):
+    """
+    Parse every GLB in input_dir (or only the given organs) into OFF files under output_dir/<organ>/,
+    or binary .boff files if binary is set. With repair, the meshes are repaired in-process
+    like mesh_hole_filling does before they are written. With clean, they first go through the
+    NumPy clean-up of numpy_repair.clean_mesh (the Blender stage's remove doubles / non-manifold clean-up).
+
+    With jobs > 1 the organs are parsed by a pool of worker processes; failures are
+    collected and summarized per organ instead of aborting the run. Returns a dict
+    organ -> list of error tracebacks (empty when everything succeeded).
+    """
+
+    if organs is None:
+        organs = list_organs(input_dir)
 
     # Parse every organ 
-    for f in files:
-        if f.endswith('.glb'):
-            organ = f[:-4]
+    if jobs <= 1:
+        for organ in organs:
             print("start parsing {}\n".format(organ))
-            glb_plain_parser(input_dir, organ, output_dir)
+            glb_plain_parser(input_dir, organ, output_dir, binary=binary, repair=repair, clean=clean)
             print("end parsing {}\n".format(organ))
+        return {}
+
+    tasks = make_parse_tasks(input_dir, organs, split_mb)
+    remaining = {organ: 0 for organ in organs}
+    for organ, _ in tasks:
+        remaining[organ] += 1
+
+    failures = {}
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(parse_task, input_dir, organ, output_dir, mesh_indices, binary, repair, clean): organ
+                   for organ, mesh_indices in tasks}
+        done = 0
+        for future in as_completed(futures):
+            organ = futures[future]
+            done += 1
+            try:
+                error = future.result()
+            except Exception:
+                # the worker process itself died
+                error = traceback.format_exc()
+            if error is not None:
+                failures.setdefault(organ, []).append(error)
+            remaining[organ] -= 1
+            if remaining[organ] == 0:
+                status = "failed" if organ in failures else "parsed"
+                print("[{}/{}] {} {}".format(done, len(tasks), status, organ))
+
+    print("parsed {} of {} organs".format(len(organs) - len(failures), len(organs)))
+    for organ in sorted(failures):
+        print("***************************************")
+        print("failed to parse {} ({} task(s)):".format(organ, len(failures[organ])))
+        for error in failures[organ]:
+            print(error)
+
+    return failures
     
 
 if __name__ == "__main__":
@@ -102,9 +241,17 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('input_dir')
     parser.add_argument('output_dir')
+    parser.add_argument('--jobs', type=int, help="Number of worker processes", default=1)
+    parser.add_argument('--split_mb', type=float,
+                        help="With --jobs, split organs larger than this many MB into one task per mesh", default=None)
+    parser.add_argument('--binary', action='store_true', help="Write binary .boff files instead of text OFF")
+    parser.add_argument('--repair', action='store_true', help="Repair the meshes in-process with the hra_mesh module")
+    parser.add_argument('--clean', action='store_true',
+                        help="Weld vertices, drop degenerate / duplicate faces and loose vertices and fix the winding with NumPy")
     args = parser.parse_args()
 
     input_dir = args.input_dir
     output_dir = args.output_dir
 
-    glb_parser_all(input_dir, output_dir)
+    glb_parser_all(input_dir, output_dir, args.jobs, args.split_mb, binary=args.binary, repair=args.repair,
+                   clean=args.clean)
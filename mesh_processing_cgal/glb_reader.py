@@ -0,0 +1,87 @@
+import json
+import mmap
+import struct
+
+from pygltflib import GLTF2
+from glb_accessor import mesh_arrays
+
+
+GLB_MAGIC = b'glTF'
+JSON_CHUNK = 0x4E4F534A
+BIN_CHUNK = 0x004E4942
+
+
+def read_glb_json(f):
+    """
+    Read the header and JSON chunk of a GLB from an open binary file.
+
+    Returns the JSON string, the offset of the chunk following the JSON chunk
+    and the total length of the GLB.
+    """
+    magic, _, length = struct.unpack('<4sII', f.read(12))
+    if magic != GLB_MAGIC:
+        raise IOError("Header does not appear to be valid glb format.")
+
+    json_length, chunk_type = struct.unpack('<II', f.read(8))
+    if chunk_type != JSON_CHUNK:
+        raise IOError("The first chunk of a glb file must be JSON.")
+
+    return f.read(json_length).decode('utf-8'), 20 + json_length, length
+
+
+def glb_json(file):
+    """The glTF JSON of a GLB file as a dict, without reading the binary chunk."""
+    with open(file, 'rb') as f:
+        raw_json, _, _ = read_glb_json(f)
+    return json.loads(raw_json)
+
+
+class GLBReader:
+    """
+    Streaming GLB reader.
+
+    Only the JSON chunk is parsed into memory; the BIN chunk is memory-mapped and
+    meshes are decoded on demand as views into the mapping, so at most one mesh
+    is resident at a time instead of the whole file. Use as a context manager;
+    every array returned by mesh_arrays must be released before the reader is closed.
+    """
+
+    def __init__(self, file):
+        self.file = open(file, 'rb')
+        raw_json, offset, length = read_glb_json(self.file)
+        self.gltf = GLTF2.from_json(raw_json, infer_missing=True)
+
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(b'')
+        # chunks are 4-byte aligned; the BIN chunk, if any, follows the JSON chunk
+        while offset + 8 <= length:
+            chunk_length, chunk_type = struct.unpack_from('<II', self.mmap, offset)
+            if chunk_type == BIN_CHUNK:
+                self.buffer = memoryview(self.mmap)[offset + 8:offset + 8 + chunk_length]
+                break
+            offset += 8 + chunk_length
+
+    def mesh_arrays(self, mesh_index):
+        """Points and triangles of one mesh, as views into the mapped BIN chunk when possible."""
+        return mesh_arrays(self.gltf, self.buffer, self.gltf.meshes[mesh_index])
+
+    def release(self):
+        """Tell the kernel the pages read so far are no longer needed (Linux/macOS only)."""
+        if hasattr(self.mmap, 'madvise') and hasattr(mmap, 'MADV_DONTNEED'):
+            self.mmap.madvise(mmap.MADV_DONTNEED)
+
+    def close(self):
+        try:
+            self.buffer.release()
+            self.mmap.close()
+        except BufferError:
+            # arrays still point into the mapping (e.g. kept alive by a traceback);
+            # it is unmapped once they are garbage collected
+            pass
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
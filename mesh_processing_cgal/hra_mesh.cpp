@@ -0,0 +1,171 @@
+// Python bindings of the geometry library (Mymesh) and of the mesh_hole_filling
+// repair step, working on NumPy arrays instead of OFF files.
+//
+//   import hra_mesh
+//   vertices, faces, oriented = hra_mesh.repair(vertices, faces)
+//   m = hra_mesh.Mymesh.from_arrays(vertices, faces)
+//   inside = m.points_inside(points, num_threads=8)
+
+#include <pybind11/pybind11.h>
+#include <pybind11/numpy.h>
+#include <pybind11/stl.h>
+
+#include <CGAL/Exact_predicates_inexact_constructions_kernel.h>
+#include "mymesh.h"
+#include "mesh_repair.h"
+
+#include <cstdint>
+#include <stdexcept>
+
+namespace py = pybind11;
+
+typedef py::array_t<double, py::array::c_style | py::array::forcecast> Vertex_array;
+typedef py::array_t<std::int64_t, py::array::c_style | py::array::forcecast> Face_array;
+
+// mesh_hole_filling uses the EPICK kernel, the repair binding does the same so results match
+typedef CGAL::Exact_predicates_inexact_constructions_kernel Repair_kernel;
+typedef CGAL::Surface_mesh<Repair_kernel::Point_3> Repair_mesh;
+
+
+template <class PointT>
+void array_to_points(const Vertex_array &vertices, std::vector<PointT> &points)
+{
+    if (vertices.ndim() != 2 || vertices.shape(1) != 3) throw std::invalid_argument("points must have shape (n, 3)");
+
+    auto v = vertices.unchecked<2>();
+    points.reserve(v.shape(0));
+    for (py::ssize_t i = 0; i < v.shape(0); i++) points.emplace_back(v(i, 0), v(i, 1), v(i, 2));
+}
+
+
+template <class PointT>
+void arrays_to_soup(const Vertex_array &vertices, const Face_array &faces,
+                    std::vector<PointT> &points, std::vector<std::vector<std::size_t> > &polygons)
+{
+    if (faces.ndim() != 2 || faces.shape(1) != 3) throw std::invalid_argument("faces must have shape (m, 3)");
+    array_to_points(vertices, points);
+
+    auto v = vertices.unchecked<2>();
+    auto f = faces.unchecked<2>();
+    polygons.reserve(f.shape(0));
+    for (py::ssize_t i = 0; i < f.shape(0); i++)
+    {
+        for (py::ssize_t j = 0; j < 3; j++)
+            if (f(i, j) < 0 || f(i, j) >= v.shape(0)) throw std::out_of_range("face index out of range");
+        polygons.push_back({std::size_t(f(i, 0)), std::size_t(f(i, 1)), std::size_t(f(i, 2))});
+    }
+}
+
+
+// (vertices, faces) arrays of a triangle mesh, with compact vertex indices
+template <class MeshT>
+py::tuple mesh_to_arrays(const MeshT &mesh)
+{
+    py::array_t<double> vertices(std::vector<py::ssize_t>{py::ssize_t(mesh.number_of_vertices()), 3});
+    py::array_t<std::int64_t> faces(std::vector<py::ssize_t>{py::ssize_t(mesh.number_of_faces()), 3});
+    auto v = vertices.mutable_unchecked<2>();
+    auto f = faces.mutable_unchecked<2>();
+
+    std::vector<std::int64_t> index(mesh.num_vertices());
+    std::int64_t i = 0;
+    for (auto vd : mesh.vertices())
+    {
+        const auto &p = mesh.point(vd);
+        v(i, 0) = CGAL::to_double(p.x());
+        v(i, 1) = CGAL::to_double(p.y());
+        v(i, 2) = CGAL::to_double(p.z());
+        index[vd] = i++;
+    }
+
+    i = 0;
+    for (auto fd : mesh.faces())
+    {
+        int j = 0;
+        for (auto vd : CGAL::vertices_around_face(mesh.halfedge(fd), mesh))
+        {
+            if (j == 3) throw std::runtime_error("non-triangular face in mesh");
+            f(i, j++) = index[vd];
+        }
+        i++;
+    }
+    return py::make_tuple(vertices, faces);
+}
+
+
+py::tuple repair(const Vertex_array &vertices, const Face_array &faces)
+{
+    std::vector<Repair_kernel::Point_3> points;
+    std::vector<std::vector<std::size_t> > polygons;
+    arrays_to_soup(vertices, faces, points, polygons);
+
+    Repair_mesh mesh;
+    bool oriented;
+    {
+        py::gil_scoped_release release;
+        oriented = polygon_soup_to_repaired_mesh(points, polygons, mesh);
+    }
+    py::tuple arrays = mesh_to_arrays(mesh);
+    return py::make_tuple(arrays[0], arrays[1], oriented);
+}
+
+
+Mymesh mymesh_from_arrays(const Vertex_array &vertices, const Face_array &faces)
+{
+    std::vector<Point> points;
+    std::vector<std::vector<std::size_t> > polygons;
+    arrays_to_soup(vertices, faces, points, polygons);
+
+    Surface_mesh mesh;
+    polygon_soup_to_repaired_mesh(points, polygons, mesh);
+    Mymesh m(mesh);
+    m.is_surface = true;
+    m.is_closed = CGAL::is_closed(m.get_raw_mesh());
+    return m;
+}
+
+
+// point queries need the AABB tree, build it on first use
+void ensure_aabb_tree(Mymesh &m)
+{
+    if (!m.aabbTree) m.create_aabb_tree();
+}
+
+
+PYBIND11_MODULE(hra_mesh, module)
+{
+    module.doc() = "CGAL geometry library (Mymesh) and mesh_hole_filling repair on NumPy arrays";
+
+    module.def("repair", &repair, py::arg("vertices"), py::arg("faces"),
+               "Repair a triangle soup like mesh_hole_filling does. Returns (vertices, faces, oriented).");
+
+    py::class_<Mymesh>(module, "Mymesh")
+        .def(py::init<>())
+        .def(py::init<const std::string &>(), py::arg("file_path"))
+        .def_static("from_arrays", &mymesh_from_arrays, py::arg("vertices"), py::arg("faces"))
+        .def("load_from_off", &Mymesh::load_from_off, py::arg("file_path"))
+        .def("triangulate_mesh", &Mymesh::triangulate_mesh)
+        .def("create_aabb_tree", &Mymesh::create_aabb_tree, py::call_guard<py::gil_scoped_release>())
+        .def("point_inside", [](Mymesh &m, double x, double y, double z)
+        {
+            ensure_aabb_tree(m);
+            Point query(x, y, z);
+            return m.point_inside(query);
+        }, py::arg("x"), py::arg("y"), py::arg("z"))
+        .def("points_inside", [](Mymesh &m, const Vertex_array &points, unsigned int num_threads)
+        {
+            std::vector<Point> query;
+            array_to_points(points, query);
+
+            std::vector<unsigned char> inside;
+            {
+                py::gil_scoped_release release;
+                ensure_aabb_tree(m);
+                m.points_inside(query, inside, num_threads);
+            }
+            return py::array_t<std::uint8_t>(py::ssize_t(inside.size()), inside.data());
+        }, py::arg("points"), py::arg("num_threads") = 1)
+        .def("to_arrays", [](Mymesh &m) { return mesh_to_arrays(m.get_raw_mesh()); })
+        .def_readonly("label", &Mymesh::label)
+        .def_readonly("is_closed", &Mymesh::is_closed)
+        .def_readonly("is_surface", &Mymesh::is_surface);
+}
@@ -1,70 +1,202 @@
 #include <iostream>
 #include <fstream>
+#include <sstream>
+#include <algorithm>
+#include <atomic>
+#include <chrono>
+#include <cstdlib>
+#include <thread>
 #include "mymesh.h"
 
 #include <boost/filesystem.hpp>
 
 using namespace boost::filesystem;
 
+// Uses TBB for the self-intersection test when CGAL is linked with it, sequential otherwise.
+typedef CGAL::Parallel_if_available_tag Concurrency_tag;
 
-void check_manifold(std::string &body_path, std::string &output_path)
+
+// result of the checks on one mesh, one row of the csv / one object of the json output
+struct Check_result
+{
+    std::string organ;
+    std::string name;
+    path file_path;
+    std::uintmax_t size = 0;
+    bool is_manifold = false;
+    bool is_closed = false;
+    bool is_self_intersected = false;
+    std::size_t vertices = 0;
+    std::size_t faces = 0;
+    CGAL::Bbox_3 bbox;
+    double seconds = 0.0;
+};
+
+
+void check_mesh(Check_result &result)
+{
+    auto start = std::chrono::steady_clock::now();
+
+    Mymesh m;
+    std::string path = result.file_path.string();
+    result.is_manifold = m.load_from_off(path);
+    if (!result.is_manifold)
+    {
+        std::cout << result.organ << " " << result.name << " is not 2-manifold" << std::endl;
+    }
+    else
+    {
+        Surface_mesh &raw_mesh = m.get_raw_mesh();
+
+        result.is_self_intersected = PMP::does_self_intersect<Concurrency_tag>(raw_mesh);
+        result.is_closed = CGAL::is_closed(raw_mesh);
+        result.vertices = raw_mesh.number_of_vertices();
+        result.faces = raw_mesh.number_of_faces();
+        result.bbox = PMP::bbox(raw_mesh);
+
+        if (!result.is_closed) std::cout << result.organ << " " << result.name << " is not closed" << std::endl;
+        if (result.is_self_intersected) std::cout << result.organ << " " << result.name << " has-intersections" << std::endl;
+    }
+
+    std::chrono::duration<double> elapsed = std::chrono::steady_clock::now() - start;
+    result.seconds = elapsed.count();
+}
+
+
+std::string yes_no(bool value)
+{
+    return value ? "Yes" : "No";
+}
+
+
+// quote a string for json; organ and mesh names only need quotes and backslashes escaped
+std::string json_string(const std::string &s)
+{
+    std::string quoted = "\"";
+    for (char c : s)
+    {
+        if (c == '"' || c == '\\') quoted += '\\';
+        quoted += c;
+    }
+    return quoted + "\"";
+}
+
+
+// quote a csv field when it holds a separator, quote or line break (RFC 4180), so every row keeps its columns
+std::string csv_string(const std::string &s)
+{
+    if (s.find_first_of(",\"\r\n") == std::string::npos) return s;
+    std::string quoted = "\"";
+    for (char c : s)
+    {
+        if (c == '"') quoted += '"';
+        quoted += c;
+    }
+    return quoted + "\"";
+}
+
+
+void write_csv(const std::vector<Check_result> &results, const std::string &output_path)
 {
-    std::ofstream output_file;
-    output_file.open(output_path);
-    output_file << "organ,mesh,2-manifold,closed,self-intersection,watertight\n";
+    std::ofstream output_file(output_path);
+    output_file.precision(17);
+    output_file << "organ,mesh,2-manifold,closed,self-intersection,watertight,"
+                << "vertices,faces,xmin,ymin,zmin,xmax,ymax,zmax,seconds\n";
 
-    for (directory_entry& organ_path : directory_iterator(body_path)) 
+    for (const Check_result &r : results)
+    {
+        output_file << csv_string(r.organ) << "," << csv_string(r.name) << "," << yes_no(r.is_manifold) << ",";
+        // meshes that could not be loaded keep every column, with "-" for the unknown values
+        if (!r.is_manifold) output_file << "-,-,-,-,-,-,-,-,-,-,-,";
+        else
+        {
+            output_file << yes_no(r.is_closed) << "," << yes_no(r.is_self_intersected) << ","
+                        << yes_no(r.is_closed && !r.is_self_intersected) << ","
+                        << r.vertices << "," << r.faces << ",";
+            // a mesh without faces has no bounding box (the default one is +-inf)
+            if (r.faces == 0) output_file << "-,-,-,-,-,-,";
+            else output_file << r.bbox.xmin() << "," << r.bbox.ymin() << "," << r.bbox.zmin() << ","
+                             << r.bbox.xmax() << "," << r.bbox.ymax() << "," << r.bbox.zmax() << ",";
+        }
+        output_file << r.seconds << "\n";
+    }
+}
+
+
+void write_json(const std::vector<Check_result> &results, const std::string &output_path)
+{
+    std::ofstream output_file(output_path);
+    output_file.precision(17);
+    output_file << "[\n";
+
+    for (std::size_t i = 0; i < results.size(); i++)
+    {
+        const Check_result &r = results[i];
+        output_file << "  {\"organ\": " << json_string(r.organ) << ", \"mesh\": " << json_string(r.name)
+                    << ", \"2-manifold\": " << (r.is_manifold ? "true" : "false");
+        if (r.is_manifold)
+        {
+            output_file << ", \"closed\": " << (r.is_closed ? "true" : "false")
+                        << ", \"self-intersection\": " << (r.is_self_intersected ? "true" : "false")
+                        << ", \"watertight\": " << (r.is_closed && !r.is_self_intersected ? "true" : "false")
+                        << ", \"vertices\": " << r.vertices << ", \"faces\": " << r.faces << ", \"bbox\": ";
+            // inf is not valid json, a mesh without faces has a null bbox
+            if (r.faces == 0) output_file << "null";
+            else output_file << "[" << r.bbox.xmin() << ", " << r.bbox.ymin() << ", " << r.bbox.zmin() << ", "
+                             << r.bbox.xmax() << ", " << r.bbox.ymax() << ", " << r.bbox.zmax() << "]";
+        }
+        else
+        {
+            output_file << ", \"closed\": null, \"self-intersection\": null, \"watertight\": null"
+                        << ", \"vertices\": null, \"faces\": null, \"bbox\": null";
+        }
+        output_file << ", \"seconds\": " << r.seconds << "}" << (i + 1 < results.size() ? ",\n" : "\n");
+    }
+    output_file << "]\n";
+}
+
+
+std::vector<Check_result> check_manifold(std::string &body_path, unsigned int num_threads)
+{
+    std::vector<Check_result> results;
+
+    for (directory_entry& organ_path : directory_iterator(body_path))
     {
         std::cout << std::endl << organ_path << std::endl;
         std::string organ_name = organ_path.path().stem().string();
 
-        for (directory_entry& entry : directory_iterator(organ_path)) 
+        for (directory_entry& entry : directory_iterator(organ_path))
         {
-            Mymesh m;
-            std::string path = entry.path().string();
-            std::string name = entry.path().stem().string();
-
-            bool success = m.load_from_off(path);
-            // std::cout << name << std::endl;
-            if (!success) 
-            {
-                std::cout << organ_name << " " << name << " is not 2-manifold" << std::endl;
-                output_file << organ_name << "," << name << "," << "No,-,-\n";
-            } 
-            else
-            {
-                Surface_mesh &raw_mesh = m.get_raw_mesh();
-
-                bool is_self_intersected = PMP::does_self_intersect(raw_mesh);
-                bool is_closed = CGAL::is_closed(raw_mesh);
-                
-                output_file << organ_name << "," << name << ",Yes,";
-                if (!is_closed) 
-                {
-                    std::cout << organ_name << " " << name << " is not closed" << std::endl;
-                    output_file << "No,";
-                }
-                else
-                {
-                    output_file << "Yes,"; 
-                }
-
-                if (is_self_intersected)
-                {
-                    std::cout << organ_name << " " << name << " has-intersections";
-                    output_file << "Yes,";
-                }
-                else
-                {
-                    output_file << "No,";
-                }
-
-                if (!is_self_intersected && is_closed) output_file << "Yes\n";
-                else output_file << "No\n";               
-
-            }
+            Check_result result;
+            result.organ = organ_name;
+            result.name = entry.path().stem().string();
+            result.file_path = entry.path();
+            result.size = file_size(entry.path());
+            results.push_back(result);
         }
     }
+
+    // check the largest files first, so the small ones fill the gaps at the end
+    std::vector<std::size_t> order(results.size());
+    for (std::size_t i = 0; i < order.size(); i++) order[i] = i;
+    std::sort(order.begin(), order.end(), [&results](std::size_t a, std::size_t b) { return results[a].size > results[b].size; });
+
+    std::atomic<std::size_t> next(0);
+    auto worker = [&results, &order, &next]()
+    {
+        for (std::size_t i = next++; i < order.size(); i = next++) check_mesh(results[order[i]]);
+    };
+    std::vector<std::thread> threads;
+    for (unsigned int t = 1; t < num_threads; t++) threads.emplace_back(worker);
+    worker();
+    for (std::thread &thread : threads) thread.join();
+
+    // report in a stable order
+    std::sort(results.begin(), results.end(), [](const Check_result &a, const Check_result &b)
+    {
+        return a.organ != b.organ ? a.organ < b.organ : a.name < b.name;
+    });
+    return results;
 }
 
 
@@ -72,16 +204,35 @@ void check_manifold(std::string &body_path, std::string &output_path)
 int main(int argc, char* argv[])
 {
     // std::string body_path = "/home/catherine/data/model/plain_with_holes/";
-    if (argc < 3)
+
+    // positional arguments plus an optional "-j N" for the number of threads
+    std::vector<std::string> args;
+    unsigned int num_threads = 1;
+    for (int i = 1; i < argc; i++)
+    {
+        std::string arg(argv[i]);
+        if (arg == "-j" && i + 1 < argc) num_threads = std::max(1, std::atoi(argv[++i]));
+        else args.push_back(arg);
+    }
+
+    if (args.size() < 2)
     {
         std::cout << "Please provide body_path and output_file name (csv file)!" << std::endl;
+        std::cout << "Usage: mesh_checker [-j num_threads] body_path output.csv [output.json]" << std::endl;
         return 0;
     }
 
-    std::string body_path = std::string(argv[1]);
-    std::string output_file = std::string(argv[2]);
+    std::string body_path = args[0];
+    std::string output_file = args[1];
+
+    auto start = std::chrono::steady_clock::now();
+    std::vector<Check_result> results = check_manifold(body_path, num_threads);
+    write_csv(results, output_file);
+    if (args.size() > 2) write_json(results, args[2]);
 
-    check_manifold(body_path, output_file);
+    std::chrono::duration<double> wall = std::chrono::steady_clock::now() - start;
+    std::cout << "checked " << results.size() << " meshes with " << num_threads << " thread(s) in "
+              << wall.count() << " s" << std::endl;
     std::cout << "end" << std::endl;
     return 0;
-}
\ No newline at end of file
+}
@@ -7,14 +7,24 @@
 #include <boost/filesystem.hpp>
 #include <iostream>
 #include <fstream>
+#include <string>
 #include <vector>
 #include <set>
+#include <cstdint>
+#include <cstring>
+#include <cstdlib>
+#include <chrono>
+#include <algorithm>
+#include <atomic>
+#include <mutex>
+#include <thread>
 
 // #include <CGAL/IO/OFF_reader.h>
 #include <CGAL/IO/polygon_soup_io.h>
 #include <CGAL/Polygon_mesh_processing/orient_polygon_soup.h>
 #include <CGAL/Polygon_mesh_processing/polygon_soup_to_polygon_mesh.h>
 #include <CGAL/Polygon_mesh_processing/orientation.h>
+#include "mesh_repair.h"
 
 
 typedef CGAL::Exact_predicates_inexact_constructions_kernel Kernel;
@@ -46,37 +56,111 @@ bool is_small_hole(halfedge_descriptor h, Mesh & mesh,
   return true;
 }
 
-// load non-manifold
-void load_non_manifold_mesh(std::string file_path, Mesh &mesh)
+// read the binary .boff hand-off written by glb_parser.save_single_mesh_binary (little-endian):
+// "BOFF", uint32 version, uint32 #points, uint32 #triangles, float32 x y z per point, uint32 a b c per triangle
+bool read_binary_soup(const std::string &file_path, std::vector<Point> &points,
+                      std::vector<std::vector<std::size_t> > &polygons)
+{
+  std::ifstream input(file_path, std::ios::binary);
+  char magic[4];
+  std::uint32_t header[3];
+  if (!input.read(magic, 4) || std::strncmp(magic, "BOFF", 4) != 0) return false;
+  if (!input.read(reinterpret_cast<char*>(header), sizeof(header)) || header[0] != 1) return false;
+
+  std::vector<float> coords(3 * std::size_t(header[1]));
+  std::vector<std::uint32_t> indices(3 * std::size_t(header[2]));
+  if (!input.read(reinterpret_cast<char*>(coords.data()), coords.size() * sizeof(float))) return false;
+  if (!input.read(reinterpret_cast<char*>(indices.data()), indices.size() * sizeof(std::uint32_t))) return false;
+
+  points.reserve(header[1]);
+  for (std::size_t i = 0; i < coords.size(); i += 3)
+    points.emplace_back(coords[i], coords[i + 1], coords[i + 2]);
+
+  polygons.reserve(header[2]);
+  for (std::size_t i = 0; i < indices.size(); i += 3)
+  {
+    if (indices[i] >= header[1] || indices[i + 1] >= header[1] || indices[i + 2] >= header[1]) return false;
+    polygons.push_back({indices[i], indices[i + 1], indices[i + 2]});
+  }
+  return true;
+}
+
+// whether the header of a text OFF or binary .boff file declares no points, e.g. a structure whose
+// faces were all dropped by the parser's clean-up; such a file is a valid empty mesh, not a failed load
+bool declares_empty_mesh(const fs::path &file_path)
+{
+  if (file_path.extension() == ".boff")
+  {
+    std::ifstream input(file_path.string(), std::ios::binary);
+    char magic[4];
+    std::uint32_t header[3];
+    return input.read(magic, 4) && std::strncmp(magic, "BOFF", 4) == 0 &&
+           input.read(reinterpret_cast<char*>(header), sizeof(header)) && header[1] == 0;
+  }
+  std::ifstream input(file_path.string());
+  std::string magic;
+  std::size_t num_points;
+  return (input >> magic) && magic == "OFF" && (input >> num_points) && num_points == 0;
+}
+
+// how a mesh was loaded, see load_mesh
+enum Load_path { LOADED_AS_MESH = 0, LOADED_ORIENTED = 1, LOADED_EMPTY = 2, LOAD_FAILED = 3 };
+const char* load_path_names[] = {"valid polygon mesh", "oriented polygon soup", "empty", "failed"};
+
+// number of meshes and seconds spent per load path, reported at the end of main
+struct Load_stats
+{
+  std::size_t count[4] = {0, 0, 0, 0};
+  double seconds[4] = {0.0, 0.0, 0.0, 0.0};
+};
+Load_stats load_stats;
+std::mutex load_stats_mutex;
+
+// Read the file once as a polygon soup (text OFF or binary .boff), then repair
+// it with polygon_soup_to_repaired_mesh. A file declaring no points leaves mesh empty.
+Load_path load_mesh(const fs::path &file_path, Mesh &mesh)
 {
   std::vector<Point> points;
   std::vector<std::vector<std::size_t> > polygons;
 
-  if (!CGAL::IO::read_polygon_soup(file_path, points, polygons) || points.empty())
+  if (declares_empty_mesh(file_path))
+  {
+    std::cerr << file_path << " Empty mesh." << std::endl;
+    return LOADED_EMPTY;
+  }
+
+  bool success = file_path.extension() == ".boff"
+    ? read_binary_soup(file_path.string(), points, polygons)
+    : CGAL::IO::read_polygon_soup(file_path.string(), points, polygons);
+  if (!success || points.empty())
   {
-    std::cerr << "Cannot open file " << std::endl;
-    return;
+    std::cerr << "Cannot open file " << file_path << std::endl;
+    return LOAD_FAILED;
   }
 
-  CGAL::Polygon_mesh_processing::orient_polygon_soup(points, polygons);
-  CGAL::Polygon_mesh_processing::polygon_soup_to_polygon_mesh(points, polygons, mesh);
+  if (!polygon_soup_to_repaired_mesh(points, polygons, mesh)) return LOADED_AS_MESH;
 
+  std::cerr << file_path << " Not a manifold mesh." << std::endl;
+  return LOADED_ORIENTED;
 }
 
-// load manifold and non-manifold meshes
-void load_all_meshes(const fs::path &file_path, const fs::path &output_organ_dir)
+// load manifold and non-manifold meshes, returns the seconds spent on the file; an empty mesh is
+// written as an empty OFF, nothing is written for a file that cannot be loaded
+double load_all_meshes(const fs::path &file_path, const fs::path &output_organ_dir)
 {
   if (!fs::exists(output_organ_dir)) fs::create_directory(output_organ_dir);
 
   Mesh mesh;
   
-  std::ifstream input(file_path.string());
-  if ( !input || !(input >> mesh) || mesh.is_empty() ) {
-    std::cerr << file_path << " Not a manifold mesh." << std::endl;
-    //fix non-manifold meshes
-    load_non_manifold_mesh(file_path.string(), mesh);
-
+  auto start = std::chrono::steady_clock::now();
+  Load_path path = load_mesh(file_path, mesh);
+  std::chrono::duration<double> elapsed = std::chrono::steady_clock::now() - start;
+  {
+    std::lock_guard<std::mutex> lock(load_stats_mutex);
+    load_stats.count[path]++;
+    load_stats.seconds[path] += elapsed.count();
   }
+  if (path == LOAD_FAILED) return elapsed.count();
 
   // output mesh
   fs::path output_file = output_organ_dir / file_path.stem(); 
@@ -84,6 +168,35 @@ void load_all_meshes(const fs::path &file_path, const fs::path &output_organ_dir
   out.precision(17);
   out << mesh << std::endl;
 
+  std::chrono::duration<double> total = std::chrono::steady_clock::now() - start;
+  return total.count();
+}
+
+// one anatomical structure file to process
+struct Job
+{
+  fs::path file_path;
+  fs::path output_organ_dir;
+  std::uintmax_t size;
+  double seconds;
+};
+
+// Process the jobs with num_threads worker threads. Workers pull the next job
+// from a shared index, so with jobs sorted largest-first the big meshes start
+// early and the small ones fill the gaps at the end.
+void run_jobs(std::vector<Job> &jobs, unsigned int num_threads)
+{
+  std::atomic<std::size_t> next(0);
+  auto worker = [&jobs, &next]()
+  {
+    for (std::size_t i = next++; i < jobs.size(); i = next++)
+      jobs[i].seconds = load_all_meshes(jobs[i].file_path, jobs[i].output_organ_dir);
+  };
+
+  std::vector<std::thread> threads;
+  for (unsigned int t = 1; t < num_threads; t++) threads.emplace_back(worker);
+  worker();
+  for (std::thread &thread : threads) thread.join();
 }
 
 // void mesh_hole_fill_refine_fair(const fs::path &file_path, const fs::path &output_organ_dir)
@@ -144,34 +257,76 @@ int main(int argc, char* argv[])
   // std::string body_path = "/home/catherine/data/model/plain_with_holes/";
   // std::string output_dir = "/home/catherine/data/model/plain_filling_hole";
 
-  if (argc < 3)
+  // positional arguments plus an optional "-j N" for the number of threads
+  std::vector<std::string> args;
+  unsigned int num_threads = 1;
+  for (int i = 1; i < argc; i++)
   {
-    std::cout << "Please provide body_path and output_dir!" << std::endl;
+    std::string arg(argv[i]);
+    if (arg == "-j" && i + 1 < argc) num_threads = std::max(1, std::atoi(argv[++i]));
+    else args.push_back(arg);
+  }
+
+  if (args.size() < 2)
+  {
+    std::cout << "Please provide body_path and output_dir (and optionally a single organ name)!" << std::endl;
+    std::cout << "Usage: mesh_hole_filling [-j num_threads] body_path output_dir [organ]" << std::endl;
     return 0;
   }
 
-  std::string body_path = std::string(argv[1]);
-  std::string output_dir = std::string(argv[2]);
+  std::string body_path = args[0];
+  std::string output_dir = args[1];
+  // only process this organ if given, used by the incremental build
+  std::string only_organ = args.size() > 2 ? args[2] : "";
   
+  auto start = std::chrono::steady_clock::now();
   if (!fs::exists(output_dir)) fs::create_directory(output_dir);
   fs::path dir(output_dir);
+  std::vector<Job> jobs;
   for (fs::directory_entry& organ_path : fs::directory_iterator(body_path)) 
   {
-        std::cout << std::endl << organ_path << std::endl;
         // fs::path organ_name = organ_path.path().stem();
         fs::path organ_name = organ_path.path().filename();
+        if (!only_organ.empty() && organ_name.string() != only_organ) continue;
+
+        std::cout << std::endl << organ_path << std::endl;
 
         std::cout << "organ name: " << organ_name << std::endl;
         fs::path output_organ_dir = dir / organ_name;
+        // created here rather than by the worker threads
+        if (!fs::exists(output_organ_dir)) fs::create_directory(output_organ_dir);
         
         for (fs::directory_entry& AS : fs::directory_iterator(organ_path)) 
         {
           // mesh_hole_fill_refine_fair(AS.path(), output_organ_dir);
-          load_all_meshes(AS.path(), output_organ_dir);
+          jobs.push_back({AS.path(), output_organ_dir, fs::file_size(AS.path()), 0.0});
 
         }
   }
 
-  return 0;
+  // largest file first
+  std::sort(jobs.begin(), jobs.end(), [](const Job &a, const Job &b) { return a.size > b.size; });
+  run_jobs(jobs, num_threads);
+  std::chrono::duration<double> wall = std::chrono::steady_clock::now() - start;
+
+  double busy = 0.0;
+  for (const Job &job : jobs) busy += job.seconds;
+  std::cout << std::endl << "Processed " << jobs.size() << " meshes with " << num_threads << " thread(s) in "
+            << wall.count() << " s (" << busy << " s of work)" << std::endl;
+
+  std::vector<Job> slowest(jobs);
+  std::sort(slowest.begin(), slowest.end(), [](const Job &a, const Job &b) { return a.seconds > b.seconds; });
+  if (slowest.size() > 10) slowest.resize(10);
+  std::cout << "Slowest meshes:" << std::endl;
+  for (const Job &job : slowest)
+    std::cout << "  " << job.file_path << ": " << job.seconds << " s" << std::endl;
+
+  std::cout << std::endl << "Loaded meshes:" << std::endl;
+  for (int path = LOADED_AS_MESH; path <= LOAD_FAILED; path++)
+    std::cout << "  " << load_path_names[path] << ": " << load_stats.count[path]
+              << " meshes in " << load_stats.seconds[path] << " s" << std::endl;
+
+  // a failed mesh fails the run, so the build cache does not store the organ without it
+  return load_stats.count[LOAD_FAILED] > 0 ? 1 : 0;
 }
 
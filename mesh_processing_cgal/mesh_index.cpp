@@ -0,0 +1,92 @@
+#include <iostream>
+#include <algorithm>
+#include <atomic>
+#include <chrono>
+#include <cstdlib>
+#include <mutex>
+#include <thread>
+#include "mymesh.h"
+
+#include <boost/filesystem.hpp>
+
+using namespace boost::filesystem;
+
+// Builds the mesh index files (see Mymesh::write_index) of every mesh of body_path into
+// index_dir/<organ>/<mesh>.idx, so mesh_query can map them instead of parsing and triangulating
+// the OFF files (it still builds the AABB trees). Index files whose content hash still matches
+// their OFF file are left untouched.
+
+
+struct Index_job
+{
+    std::string off_path;
+    std::string index_path;
+    std::uintmax_t size;
+};
+
+
+int main(int argc, char* argv[])
+{
+    // positional arguments plus an optional "-j N" for the number of threads
+    std::vector<std::string> args;
+    unsigned int num_threads = 1;
+    for (int i = 1; i < argc; i++)
+    {
+        std::string arg(argv[i]);
+        if (arg == "-j" && i + 1 < argc) num_threads = std::max(1, std::atoi(argv[++i]));
+        else args.push_back(arg);
+    }
+
+    if (args.size() < 2)
+    {
+        std::cout << "Please provide body_path and index_dir!" << std::endl;
+        std::cout << "Usage: mesh_index [-j num_threads] body_path index_dir" << std::endl;
+        std::cout << "Index files skip parsing and triangulating the OFF files; the AABB trees are still built at load time." << std::endl;
+        return 0;
+    }
+
+    std::vector<Index_job> jobs;
+    for (directory_entry& organ_path : directory_iterator(args[0]))
+    {
+        path organ_index_dir = path(args[1]) / organ_path.path().filename();
+        create_directories(organ_index_dir);
+        for (directory_entry& entry : directory_iterator(organ_path))
+        {
+            path index_path = organ_index_dir / (entry.path().stem().string() + ".idx");
+            jobs.push_back({entry.path().string(), index_path.string(), file_size(entry.path())});
+        }
+    }
+
+    // largest meshes first, so the small ones fill the gaps at the end
+    std::sort(jobs.begin(), jobs.end(), [](const Index_job &a, const Index_job &b) { return a.size > b.size; });
+
+    auto start = std::chrono::steady_clock::now();
+    std::atomic<std::size_t> next(0), reused(0), built(0), failed(0);
+    std::mutex print_mutex;
+    auto worker = [&]()
+    {
+        for (std::size_t i = next++; i < jobs.size(); i = next++)
+        {
+            const Index_job &job = jobs[i];
+            Mymesh m;
+            std::uint64_t content_hash = mesh_file_hash(job.off_path);
+            if (exists(job.index_path) && m.load_from_index(job.index_path, content_hash)) reused++;
+            else if (m.load_from_off(job.off_path) && m.triangulate_mesh() && m.write_index(job.index_path, content_hash)) built++;
+            else
+            {
+                failed++;
+                std::lock_guard<std::mutex> lock(print_mutex);
+                std::cout << "cannot index " << job.off_path << std::endl;
+            }
+        }
+    };
+    std::vector<std::thread> threads;
+    for (unsigned int t = 1; t < num_threads; t++) threads.emplace_back(worker);
+    worker();
+    for (std::thread &thread : threads) thread.join();
+
+    std::chrono::duration<double> wall = std::chrono::steady_clock::now() - start;
+    std::cout << "indexed " << jobs.size() << " meshes (" << built << " built, " << reused << " up to date, "
+              << failed << " failed) with " << num_threads << " thread(s) in " << wall.count() << " s" << std::endl;
+    return failed > 0 ? 1 : 0;
+}
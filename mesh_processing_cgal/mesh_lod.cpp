@@ -0,0 +1,179 @@
+#include <CGAL/Exact_predicates_inexact_constructions_kernel.h>
+#include <CGAL/Surface_mesh.h>
+#include <CGAL/Surface_mesh_simplification/edge_collapse.h>
+#include <CGAL/Polygon_mesh_processing/triangulate_faces.h>
+#include <CGAL/IO/polygon_soup_io.h>
+#include <boost/filesystem.hpp>
+#include <iostream>
+#include <fstream>
+#include <vector>
+#include <cstdlib>
+#include <chrono>
+#include <algorithm>
+#include <atomic>
+#include <functional>
+#include <mutex>
+#include <thread>
+#include "mesh_repair.h"
+
+// Level of detail versions of the repaired meshes, without Blender: every mesh of
+// body_path/<organ>/ is simplified with CGAL's edge collapse and written to
+// output_dir/<lod>/<organ>/<mesh>.off for every requested level (percentage of the faces kept).
+// The levels are produced one after the other from the largest, each from the previous one.
+
+
+typedef CGAL::Exact_predicates_inexact_constructions_kernel Kernel;
+typedef Kernel::Point_3                                     Point;
+typedef CGAL::Surface_mesh<Point>                           Mesh;
+namespace SMS = CGAL::Surface_mesh_simplification;
+namespace PMP = CGAL::Polygon_mesh_processing;
+namespace fs = boost::filesystem;
+
+
+// stops the edge collapse once the mesh is down to a number of faces
+// (the stop predicates shipped with CGAL count edges, or faces only in recent versions)
+struct Face_count_stop
+{
+  const Mesh &mesh;
+  std::size_t max_faces;
+
+  template <class FT, class Profile>
+  bool operator()(const FT&, const Profile&, std::size_t, std::size_t) const
+  {
+    return mesh.number_of_faces() <= max_faces;
+  }
+};
+
+// one mesh to simplify
+struct Job
+{
+  fs::path file_path;
+  std::string organ;
+  std::uintmax_t size;
+  bool ok;
+};
+
+// simplify one mesh to every level, level_faces sums the faces written per level over all meshes
+bool simplify(const Job &job, const std::vector<int> &levels, const fs::path &output_dir,
+              std::vector<std::atomic<std::size_t> > &level_faces)
+{
+  std::vector<Point> points;
+  std::vector<std::vector<std::size_t> > polygons;
+  if (!CGAL::IO::read_polygon_soup(job.file_path.string(), points, polygons) || points.empty())
+  {
+    std::cerr << "Cannot open file " << job.file_path << std::endl;
+    return false;
+  }
+
+  Mesh mesh;
+  polygon_soup_to_repaired_mesh(points, polygons, mesh);
+  if (!CGAL::is_triangle_mesh(mesh)) PMP::triangulate_faces(mesh);
+  const std::size_t faces = mesh.number_of_faces();
+
+  for (std::size_t i = 0; i < levels.size(); i++)
+  {
+    std::size_t target = faces * levels[i] / 100;
+    if (target < mesh.number_of_faces())
+    {
+      Face_count_stop stop{mesh, target};
+      SMS::edge_collapse(mesh, stop);
+    }
+
+    fs::path output_organ_dir = output_dir / std::to_string(levels[i]) / job.organ;
+    std::ofstream out((output_organ_dir / job.file_path.stem()).string() + ".off");
+    out.precision(17);
+    out << mesh << std::endl;
+    if (!out) return false;
+    level_faces[i] += mesh.number_of_faces();
+  }
+  return true;
+}
+
+
+int main(int argc, char* argv[])
+{
+  // positional arguments plus "-j N" for the number of threads and one "-lod P" per level
+  std::vector<std::string> args;
+  std::vector<int> levels;
+  unsigned int num_threads = 1;
+  for (int i = 1; i < argc; i++)
+  {
+    std::string arg(argv[i]);
+    if (arg == "-j" && i + 1 < argc) num_threads = std::max(1, std::atoi(argv[++i]));
+    else if (arg == "-lod" && i + 1 < argc) levels.push_back(std::atoi(argv[++i]));
+    else args.push_back(arg);
+  }
+
+  if (args.size() < 2 || levels.empty())
+  {
+    std::cout << "Please provide body_path, output_dir and at least one level (percentage of faces kept)!" << std::endl;
+    std::cout << "Usage: mesh_lod [-j num_threads] -lod 50 [-lod 20 ...] body_path output_dir [organ]" << std::endl;
+    return 0;
+  }
+  for (int level : levels)
+  {
+    if (level <= 0 || level > 100)
+    {
+      std::cout << "Levels must be between 1 and 100, got " << level << std::endl;
+      return 1;
+    }
+  }
+  // largest level first, every level is simplified from the previous one
+  std::sort(levels.begin(), levels.end(), std::greater<int>());
+  levels.erase(std::unique(levels.begin(), levels.end()), levels.end());
+
+  fs::path body_path(args[0]);
+  fs::path output_dir(args[1]);
+  std::string only_organ = args.size() > 2 ? args[2] : "";
+
+  std::vector<Job> jobs;
+  for (fs::directory_entry& organ_path : fs::directory_iterator(body_path))
+  {
+    std::string organ = organ_path.path().filename().string();
+    if (!only_organ.empty() && organ != only_organ) continue;
+
+    // created here rather than by the worker threads
+    for (int level : levels) fs::create_directories(output_dir / std::to_string(level) / organ);
+    for (fs::directory_entry& AS : fs::directory_iterator(organ_path))
+      jobs.push_back({AS.path(), organ, fs::file_size(AS.path()), false});
+  }
+
+  // largest mesh first, so the small ones fill the gaps at the end
+  std::sort(jobs.begin(), jobs.end(), [](const Job &a, const Job &b) { return a.size > b.size; });
+
+  std::vector<std::atomic<std::size_t> > faces(levels.size());
+  auto start = std::chrono::steady_clock::now();
+  std::atomic<std::size_t> next(0);
+  std::mutex print_mutex;
+  auto worker = [&]()
+  {
+    for (std::size_t i = next++; i < jobs.size(); i = next++)
+    {
+      try
+      {
+        jobs[i].ok = simplify(jobs[i], levels, output_dir, faces);
+      }
+      catch (const std::exception &e)
+      {
+        std::lock_guard<std::mutex> lock(print_mutex);
+        std::cerr << jobs[i].file_path << ": " << e.what() << std::endl;
+      }
+    }
+  };
+
+  std::vector<std::thread> threads;
+  for (unsigned int t = 1; t < num_threads; t++) threads.emplace_back(worker);
+  worker();
+  for (std::thread &thread : threads) thread.join();
+  std::chrono::duration<double> wall = std::chrono::steady_clock::now() - start;
+
+  std::size_t failed = std::count_if(jobs.begin(), jobs.end(), [](const Job &job) { return !job.ok; });
+  std::cout << "Simplified " << jobs.size() - failed << " of " << jobs.size() << " meshes with " << num_threads
+            << " thread(s) in " << wall.count() << " s" << std::endl;
+  for (std::size_t i = 0; i < levels.size(); i++)
+    std::cout << "  lod " << levels[i] << ": " << faces[i] << " faces" << std::endl;
+  for (const Job &job : jobs)
+    if (!job.ok) std::cout << "failed: " << job.file_path << std::endl;
+
+  return failed ? 1 : 0;
+}
@@ -0,0 +1,123 @@
+#include <iostream>
+#include <memory>
+#include <fstream>
+#include <algorithm>
+#include <chrono>
+#include <cstdlib>
+#include "mymesh.h"
+
+#include <boost/filesystem.hpp>
+
+using namespace boost::filesystem;
+
+
+double seconds_since(std::chrono::steady_clock::time_point start)
+{
+    std::chrono::duration<double> elapsed = std::chrono::steady_clock::now() - start;
+    return elapsed.count();
+}
+
+
+// query points are a raw little-endian float64 array of x y z triplets, e.g. numpy's points.astype('<f8').tofile()
+bool load_query_points(const std::string &file_path, std::vector<Point> &points)
+{
+    std::ifstream input(file_path, std::ios::binary | std::ios::ate);
+    if (!input) return false;
+    std::streamsize size = input.tellg();
+    if (size % (3 * sizeof(double)) != 0) return false;
+
+    std::vector<double> coords(size / sizeof(double));
+    input.seekg(0);
+    if (!input.read(reinterpret_cast<char*>(coords.data()), size)) return false;
+
+    points.reserve(coords.size() / 3);
+    for (std::size_t i = 0; i < coords.size(); i += 3)
+        points.emplace_back(coords[i], coords[i + 1], coords[i + 2]);
+    return true;
+}
+
+
+int main(int argc, char* argv[])
+{
+    // positional arguments plus an optional "-j N" for the number of threads
+    // and "-index dir" for the mesh index files written by mesh_index
+    std::vector<std::string> args;
+    unsigned int num_threads = 1;
+    std::string index_dir;
+    for (int i = 1; i < argc; i++)
+    {
+        std::string arg(argv[i]);
+        if (arg == "-j" && i + 1 < argc) num_threads = std::max(1, std::atoi(argv[++i]));
+        else if (arg == "-index" && i + 1 < argc) index_dir = argv[++i];
+        else args.push_back(arg);
+    }
+
+    if (args.size() < 4)
+    {
+        std::cout << "Please provide body_path, query points, output file and summary file (csv)!" << std::endl;
+        std::cout << "Usage: mesh_query [-j num_threads] [-index index_dir] body_path points.bin inside.bin summary.csv" << std::endl;
+        return 0;
+    }
+
+    std::string body_path = args[0];
+
+    // load every mesh, then build the AABB trees; meshes are held by pointer, so they are never
+    // copied or moved while the list grows and each tree keeps pointing at its own mesh
+    auto start = std::chrono::steady_clock::now();
+    std::vector<std::string> organs, names;
+    std::vector<std::unique_ptr<Mymesh> > meshes;
+    for (directory_entry& organ_path : directory_iterator(body_path))
+    {
+        std::string organ_name = organ_path.path().stem().string();
+        for (directory_entry& entry : directory_iterator(organ_path))
+        {
+            organs.push_back(organ_name);
+            names.push_back(entry.path().stem().string());
+            if (index_dir.empty()) meshes.push_back(std::make_unique<Mymesh>(entry.path().string()));
+            else
+            {
+                // stale or missing index files are rebuilt from the OFF file
+                path index_path = path(index_dir) / organ_path.path().filename() / (names.back() + ".idx");
+                meshes.push_back(std::make_unique<Mymesh>());
+                meshes.back()->load_with_index(entry.path().string(), index_path.string());
+            }
+        }
+    }
+    for (std::unique_ptr<Mymesh> &m : meshes)
+        if (m->is_surface && m->is_closed) m->create_aabb_tree();
+    double load_seconds = seconds_since(start);
+
+    std::vector<Point> points;
+    if (!load_query_points(args[1], points))
+    {
+        std::cerr << "Cannot read query points from " << args[1] << std::endl;
+        return 1;
+    }
+
+    // one row of inside flags (uint8) per mesh, in the order of the summary file
+    std::ofstream inside_file(args[2], std::ios::binary);
+    std::ofstream summary_file(args[3]);
+    summary_file << "organ,mesh,queried,inside,seconds\n";
+
+    start = std::chrono::steady_clock::now();
+    std::vector<unsigned char> inside;
+    for (std::size_t i = 0; i < meshes.size(); i++)
+    {
+        Mymesh &m = *meshes[i];
+        auto mesh_start = std::chrono::steady_clock::now();
+        // inside tests need a closed mesh, the others are reported as not queried with all points outside
+        bool queried = m.is_surface && m.is_closed;
+        if (queried) m.points_inside(points, inside, num_threads);
+        else inside.assign(points.size(), 0);
+
+        inside_file.write(reinterpret_cast<const char*>(inside.data()), inside.size());
+        summary_file << organs[i] << "," << names[i] << "," << (queried ? "Yes" : "No") << ","
+                     << std::count(inside.begin(), inside.end(), 1) << "," << seconds_since(mesh_start) << "\n";
+    }
+    double query_seconds = seconds_since(start);
+
+    std::cout << "loaded " << meshes.size() << " meshes and built their AABB trees in " << load_seconds << " s" << std::endl;
+    std::cout << "queried " << points.size() << " points against every mesh with " << num_threads << " thread(s) in "
+              << query_seconds << " s" << std::endl;
+    return 0;
+}
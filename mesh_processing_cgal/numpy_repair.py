@@ -0,0 +1,213 @@
+import numpy as np
+
+
+# NumPy version of the clean-up the Blender stage runs before export (remove_doubles and
+# print3d_clean_non_manifold in mesh_processing_blender/HuBMAP_reduction.py), for builds that
+# skip Blender. Works on the (points, triangles) arrays returned by glb_reader / glb_accessor.
+
+# same merge distance as the Blender stage's remove_doubles
+WELD_TOLERANCE = 0.0001
+
+
+def unique_rows(rows, **kwargs):
+    """
+    np.unique(rows, axis=0) for integer rows, several times faster: rows are packed into one
+    int64 key when their value range allows it, since sorting rows as a whole is slow.
+    """
+    if len(rows) == 0:
+        return np.unique(rows, axis=0, **kwargs)
+    low = rows.min(axis=0)
+    spans = rows.max(axis=0) - low + 1
+    if np.prod(spans.astype(np.float64)) >= 2 ** 62:
+        return np.unique(rows, axis=0, **kwargs)
+    keys = np.zeros(len(rows), dtype=np.int64)
+    for column, span in zip((rows - low).T, spans):
+        keys = keys * int(span) + column
+    return np.unique(keys, **kwargs)
+
+
+def weld_vertices(points, triangles, tolerance=WELD_TOLERANCE):
+    """
+    Merge the points that fall into the same cell of a grid of size tolerance.
+
+    Snapping to a grid instead of searching neighbours keeps it vectorized; two points
+    closer than tolerance but on both sides of a cell boundary are not merged. Each
+    merged point keeps the coordinates of its first occurrence.
+    """
+    if tolerance > 0:
+        keys = np.floor(np.asarray(points, dtype=np.float64) / tolerance).astype(np.int64)
+        _, first, inverse = unique_rows(keys, return_index=True, return_inverse=True)
+    else:
+        _, first, inverse = np.unique(points, axis=0, return_index=True, return_inverse=True)
+    return np.asarray(points)[first], inverse.reshape(-1)[triangles]
+
+
+# a triangle is flat when its height is below this fraction of its longest edge
+COLLINEAR = 1e-6
+
+
+def degenerate_faces(points, triangles):
+    """Mask of the triangles using a vertex twice or with their corners on a line (zero area up to rounding)"""
+    repeated = ((triangles[:, 0] == triangles[:, 1]) | (triangles[:, 1] == triangles[:, 2]) |
+                (triangles[:, 2] == triangles[:, 0]))
+    corners = points[triangles].astype(np.float64)
+    edges = corners[:, [1, 2, 0]] - corners
+    double_area = np.linalg.norm(np.cross(edges[:, 0], edges[:, 1]), axis=1)
+    longest = np.einsum('ijk,ijk->ij', edges, edges).max(axis=1)
+    return repeated | (double_area <= COLLINEAR * longest)
+
+
+def duplicate_faces(triangles):
+    """Mask of the triangles using the same three vertices as an earlier one, whatever their order"""
+    _, first = unique_rows(np.sort(triangles, axis=1), return_index=True)
+    duplicate = np.ones(len(triangles), dtype=bool)
+    duplicate[first] = False
+    return duplicate
+
+
+def remove_loose_vertices(points, triangles):
+    """Drop the points no triangle uses and renumber the triangles"""
+    used = np.zeros(len(points), dtype=bool)
+    used[triangles.ravel()] = True
+    index = np.cumsum(used) - 1
+    return points[used], index[triangles]
+
+
+def edge_adjacency(triangles):
+    """
+    Pairs of triangles sharing a manifold edge (used by exactly two triangles).
+
+    Returns:
+        first, second: the two triangles of every manifold edge
+        same_direction: whether both run the edge in the same direction, i.e. disagree on the winding
+        open_faces: mask of the triangles with a boundary edge (used by them only)
+    """
+    count = len(triangles)
+    # directed half-edges a -> b of every triangle, half-edge h belongs to triangle h // 3
+    starts = triangles.ravel()
+    ends = triangles[:, [1, 2, 0]].ravel()
+    # undirected edge keys, sorted once so the half-edges of an edge are next to each other
+    keys = np.minimum(starts, ends) * (int(starts.max()) + 1) + np.maximum(starts, ends)
+    order = np.argsort(keys)
+    keys = keys[order]
+    run_starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    uses = np.diff(np.append(run_starts, len(keys)))
+
+    manifold = run_starts[uses == 2]
+    first, second = order[manifold], order[manifold + 1]
+    same_direction = starts[first] == starts[second]
+
+    open_faces = np.zeros(count, dtype=bool)
+    open_faces[order[run_starts[uses == 1]] // 3] = True
+    return first // 3, second // 3, same_direction, open_faces
+
+
+def propagate_flips(count, first, second, parity):
+    """
+    Connected components of the triangles linked by the pairs first[i] - second[i], each triangle
+    with whether it must be flipped to agree with its component's root (parity[i]: whether the
+    pair disagrees). Roots are hooked under a smaller neighbouring root and the trees flattened
+    by pointer jumping until no pair joins two roots, all in whole-array steps.
+
+    Returns:
+        roots: the smallest triangle of every triangle's component
+        flip: the winding parity of every triangle relative to its root
+    """
+    parent = np.arange(count)
+    flip = np.zeros(count, dtype=bool)
+    while True:
+        a, b = parent[first], parent[second]
+        joined = a != b
+        if not joined.any():
+            return parent, flip
+        relative = flip[first[joined]] ^ flip[second[joined]] ^ parity[joined]
+        high = np.maximum(a, b)[joined]
+        # a root joined several times keeps one of its hooks, parent and parity packed together
+        # so both come from the same pair
+        hook = np.empty(count, dtype=np.int64)
+        hook[high] = np.minimum(a, b)[joined] * 2 + relative
+        parent[high] = hook[high] >> 1
+        flip[high] = hook[high] & 1
+        while True:
+            up = parent[parent]
+            if np.array_equal(up, parent):
+                break
+            flip ^= flip[parent]
+            parent = up
+
+
+def orient_faces(points, triangles):
+    """
+    Make the winding consistent across every connected part of the mesh, like recalc_face_normals.
+
+    Orientation is propagated over the manifold edges; a closed part is then turned so its
+    normals point outwards (positive volume), an open part keeps the winding most of its
+    triangles had. Returns the triangles and the number of flipped ones.
+    """
+    count = len(triangles)
+    if count == 0:
+        return triangles, 0
+    first, second, same_direction, open_faces = edge_adjacency(triangles)
+
+    # on a non-orientable part (Moebius strip) some pair is left disagreeing whatever the flips
+    roots, flip = propagate_flips(count, first, second, same_direction)
+    is_root = roots == np.arange(count)
+    component = (np.cumsum(is_root) - 1)[roots]
+    components = int(np.count_nonzero(is_root))
+
+    oriented = triangles.copy()
+    oriented[flip] = oriented[flip][:, ::-1]
+
+    # closed parts point outwards, open ones follow the majority
+    corners = points[oriented].astype(np.float64)
+    volumes = np.einsum('ij,ij->i', corners[:, 0], np.cross(corners[:, 1], corners[:, 2]))
+    volume = np.bincount(component, weights=volumes, minlength=components)
+    flipped = np.bincount(component, weights=flip, minlength=components)
+    size = np.bincount(component, minlength=components)
+    open_part = np.zeros(components, dtype=bool)
+    open_part[component[open_faces]] = True
+
+    turn = np.where(open_part, flipped > size / 2, volume < 0)
+    oriented[turn[component]] = oriented[turn[component]][:, ::-1]
+    return oriented, int(np.count_nonzero(flip ^ turn[component]))
+
+
+def clean_mesh(points, triangles, tolerance=WELD_TOLERANCE):
+    """
+    Weld duplicate vertices, drop degenerate and duplicate triangles and unused vertices, and
+    make the winding consistent, in that order.
+
+    Returns:
+        points, triangles: the cleaned arrays (float32 points, uint32 triangles)
+        stats (dict): welded, degenerate, duplicate, loose and flipped counts
+
+    A mesh made only of degenerate triangles comes out empty:
+
+    >>> points, triangles, stats = clean_mesh([[0, 0, 0], [1, 0, 0], [2, 0, 0]], [[0, 1, 2]])
+    >>> triangles.shape, stats['degenerate']
+    ((0, 3), 1)
+    """
+    points = np.asarray(points, dtype=np.float32)
+    triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+    stats = {'welded': 0, 'degenerate': 0, 'duplicate': 0, 'loose': 0, 'flipped': 0}
+    if len(triangles) == 0:
+        return points, triangles.astype(np.uint32), stats
+
+    count = len(points)
+    points, triangles = weld_vertices(points, triangles, tolerance)
+    stats['welded'] = count - len(points)
+
+    degenerate = degenerate_faces(points, triangles)
+    triangles = triangles[~degenerate]
+    stats['degenerate'] = int(np.count_nonzero(degenerate))
+
+    duplicate = duplicate_faces(triangles)
+    triangles = triangles[~duplicate]
+    stats['duplicate'] = int(np.count_nonzero(duplicate))
+
+    count = len(points)
+    points, triangles = remove_loose_vertices(points, triangles)
+    stats['loose'] = count - len(points)
+
+    triangles, stats['flipped'] = orient_faces(points, triangles)
+    return points, triangles.astype(np.uint32), stats
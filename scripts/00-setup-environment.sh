@@ -36,11 +36,12 @@ if [ -e "$ENV/bin/activate" ]; then
     mkdir -p mesh_processing_cgal/build
     export CGAL_HOME=$ENV/opt/CGAL
     pushd mesh_processing_cgal/build
-      cmake ..
+      cmake -Dpybind11_DIR=`python -m pybind11 --cmakedir` ..
       make
     popd
 
     mv mesh_processing_cgal/build/mesh_* .venv/bin/
+    mv mesh_processing_cgal/build/hra_mesh*.so `python -c "import sysconfig; print(sysconfig.get_paths()['platlib'])"`/
     rm -r mesh_processing_cgal/build
   fi
 
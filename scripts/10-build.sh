@@ -5,8 +5,9 @@ if [ -e '.venv' ]; then
 fi
 
 mkdir -p dist
-rm -rf dist/*
-mkdir -p dist/original dist/glb dist/off dist/off_temp dist/model
+# keep the incremental build cache between runs, remove everything else
+find dist -mindepth 1 -maxdepth 1 ! -name cache -exec rm -rf {} +
+mkdir -p dist/original dist/glb dist/off dist/off_temp dist/model dist/cache
 
 # ENDPOINT=https://apps.humanatlas.io/api/v1/sparql
 ENDPOINT=https://apps.humanatlas.io/api--staging/v1/sparql
@@ -30,7 +31,13 @@ python all_organ_preprocessor_cgal.py \
   --downloaded_dir ../dist/original \
   --preproceesed_models_stage_1 ../dist/original \
   --output_off_model_dir ../dist/off \
-  --temp_plain_model_dir ../dist/off_temp
+  --temp_plain_model_dir ../dist/off_temp \
+  --cache_dir ../dist/cache \
+  --index_dir ../dist/cache/off_index \
+  --jobs `nproc` \
+  --pipeline \
+  --clean \
+  --binary_intermediate
 
 rm -rf ../dist/off_temp
 